@@ -1,28 +1,224 @@
+import bisect
+import codecs
 import hashlib
 import re
+import sqlite3
+import struct
 import json
+import mmap
 import unicodedata
 import os
-from flask import Flask, request, jsonify, render_template_string
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import count
+from flask import Flask, Response, g, request, jsonify, render_template_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
 # --- CONFIGURATION ---
 DEFAULT_DICT_FILENAME = 'dictionary.json'
-CURRENT_DICTIONARY = {}
-FILE_CACHE = {}
+DEFAULT_COMPILED_DICT_FILENAME = 'dictionary.rldict'
+DEFAULT_TEXT_FILENAME = 'lepetitprince.txt'
+# The default dictionary files are checked for changes at most every this
+# many seconds and reloaded in the background; None loads them only once.
+DICTIONARY_CHECK_INTERVAL = 2
+
+# Paginated books are written once to BOOK_STORE_DIR and memory-mapped; the
+# limits below bound the open books kept in FILE_CACHE, and evicted books are
+# reopened on demand. Each open book holds a file descriptor, so keep
+# FILE_CACHE_MAX_ENTRIES well below the process limit (often 1024). With
+# BOOK_STORE_DIR = None, books are kept as page lists in memory only and are
+# lost on eviction.
+FILE_CACHE_MAX_ENTRIES = 256
+FILE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+FILE_CACHE_TTL = 6 * 60 * 60  # seconds since last access
+BOOK_STORE_DIR = os.path.join('cache', 'books')
+
+# Uploaded dictionaries, keyed by content hash. None keeps them in-process
+# only; with a path, e.g. os.path.join('cache', 'store.sqlite3'), every
+# worker on the host uses the same SQLite file, so `gunicorn -w 4` can serve
+# any reader's dictionary. Books are shared through BOOK_STORE_DIR.
+SHARED_STORE_PATH = None
+
+# Compiled dictionaries kept in memory. Readers using the same dictionary
+# share one instance; evicted ones are recompiled from the shared store, or
+# must be uploaded again when there is none.
+DICTIONARY_REGISTRY_MAX_ENTRIES = 100
+DICTIONARY_REGISTRY_MAX_BYTES = 1024 * 1024 * 1024
+# Uploaded binary (.rldict) dictionaries are kept here, keyed by id. With
+# PERSIST_DICTIONARIES, every other dictionary is compiled into this format
+# in the background as well, so readers keep their dictionaries across
+# restarts and evicted ones are mapped again instead of being lost.
+DICT_STORE_DIR = os.path.join('cache', 'dictionaries')
+PERSIST_DICTIONARIES = True
+# A patched dictionary is kept and stored as its changes against the last
+# full dictionary; once there are more changes than this it becomes a full
+# dictionary itself.
+PATCH_COMPACT_SIZE = 10000
+MAPPED_DICT_PROBE_CACHE_SIZE = 20000
+# Dictionaries this app persisted come back mapped after a restart or
+# eviction, and match more slowly than compiled ones. One that has served
+# this many requests is compiled in the background and replaces the mapped
+# one; None keeps them mapped. Binary dictionaries that were provided as
+# such (dictionary.rldict, uploads) always stay mapped and shared.
+MAPPED_DICT_RECOMPILE_AFTER = 50
+
+# Steps applied to dictionary keys (once, at load time) and to every word of
+# the text. "accents" controls the folded secondary index used as a fallback
+# when the exact form is not in the dictionary.
+NORMALIZATION = {
+    "case": True,         # Petit -> petit
+    "elision": True,      # d'avoir -> davoir, j’ai -> jai
+    "punctuation": True,  # planète? -> planète
+    "accents": True,      # demandés -> demandes
+}
+NORMALIZE_CACHE_SIZE = 50000
+
+# Upper bound on the page range served by one /get_pages request
+MAX_PAGES_PER_REQUEST = 10
+
+# Page size in characters. Books are stored paginated at DEFAULT_PAGE_SIZE;
+# other sizes in the allowed range are laid out on demand from a paragraph
+# and sentence boundary index, and the last LAYOUT_CACHE_MAX_ENTRIES
+# layouts are kept.
+DEFAULT_PAGE_SIZE = 1000
+MIN_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 20000
+LAYOUT_CACHE_MAX_ENTRIES = 256
+PAGE_SIZE_CHOICES = (500, 1000, 2000, 4000)  # offered in the reader
+
+# Tokenize whole books in a process pool right after /upload_text (and for
+# the reader's book after /upload_dict). None workers means one per CPU.
+# Workers write to PAGE_STORE if there is one; otherwise the pages go to
+# PAGE_CACHE, and books whose tokens would not fit there are skipped.
+PRETOKENIZE = False
+PRETOKENIZE_WORKERS = None
+PRETOKENIZE_CHUNK = 16  # pages per task
+PRETOKENIZE_BYTES_PER_CHAR = 40  # PAGE_CACHE bytes per byte of text, roughly
+
+# Per-stage request timings (Server-Timing header) and latency / token
+# histograms for /metrics. Cache and dictionary gauges are always served.
+METRICS_ENABLED = False
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+TOKENS_BUCKETS = (50, 100, 200, 400, 800, 1600, 3200)
+
+# Uploaded texts are read, hashed and decoded in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Term -> page/position indexes built per (book, dictionary) for term search
+# and per-page vocabulary counts
+TERM_INDEX_MAX_ENTRIES = 64
+TERM_INDEX_MAX_BYTES = 64 * 1024 * 1024
+
+# Word -> pages indexes per book, used to find the pages a dictionary patch
+# can affect
+WORD_INDEX_MAX_ENTRIES = 64
+WORD_INDEX_MAX_BYTES = 64 * 1024 * 1024
+
+# Uploads are paginated by background threads, and pages can be read while
+# the rest of the book is still coming in. A partially written book that
+# has not grown for INGEST_STALE_AFTER seconds is considered abandoned.
+INGEST_WORKERS = 2
+INGEST_STALE_AFTER = 60
+
+# Tokenized pages, keyed by (text hash, page index, dictionary version).
+# Either limit may be None to disable it.
+PAGE_CACHE_MAX_ENTRIES = 5000
+PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Tokenized pages can also be written to a SQLite file, e.g.
+# os.path.join('cache', 'pages.sqlite3'), so that after a restart (or in
+# another worker) they are read back instead of tokenized again. None keeps
+# them in memory only.
+PAGE_STORE_PATH = None
+
+# The on-disk stores are swept in the background at most every
+# STORE_SWEEP_INTERVAL seconds: books and dictionaries not opened for
+# STORE_TTL seconds are deleted, then the least recently opened ones until
+# BOOK_STORE_DIR / DICT_STORE_DIR are under their byte limits, and
+# PAGE_STORE keeps its PAGE_STORE_MAX_PAGES most recently written pages.
+# Anything this process has open is kept. None disables a limit.
+STORE_SWEEP_INTERVAL = 60 * 60
+STORE_TTL = 30 * 24 * 60 * 60
+BOOK_STORE_MAX_BYTES = 10 * 1024 * 1024 * 1024
+DICT_STORE_MAX_BYTES = 10 * 1024 * 1024 * 1024
+PAGE_STORE_MAX_PAGES = 1000000
+
+# GET /page/<hash>/<page> responses. Bump PAGE_FORMAT_VERSION whenever the
+# tokens for the same text and dictionary change, so that browsers and
+# proxies stop reusing their copies.
+PAGE_FORMAT_VERSION = 1
+PAGE_MAX_AGE = 365 * 24 * 3600
+PAGE_GZIP_LEVEL = 6
+PAGE_BROTLI_QUALITY = 5
 
 # --- HELPER FUNCTIONS ---
 
+ELISION_RE = re.compile(r"['’ʼ]")
+SENTENCE_END_RE = re.compile(r'(?<=[.!?]) +')
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+def strip_accents(word):
+    # Remove accents (e.g. demandés -> demandes)
+    normalized = unicodedata.normalize('NFD', word)
+    return "".join([c for c in normalized if unicodedata.category(c) != 'Mn'])
+
+def _normalize_forms(word):
+    exact = word
+    if NORMALIZATION["case"]: exact = exact.lower()
+    if NORMALIZATION["elision"]: exact = ELISION_RE.sub('', exact)
+    if NORMALIZATION["punctuation"]: exact = PUNCTUATION_RE.sub('', exact)
+    folded = strip_accents(exact) if NORMALIZATION["accents"] else exact
+    return exact, folded
+
+def fold_key(key):
+    # Accent-folded form of a normalized dictionary key
+    return strip_accents(key) if NORMALIZATION["accents"] else key
+
+# Returns (exact, folded) for one surface word of the text. Memoized so that
+# words repeated across a page ("le", "je", "petit") are normalized once;
+# call normalize_word.cache_clear() after changing NORMALIZATION.
+normalize_word = lru_cache(maxsize=NORMALIZE_CACHE_SIZE)(_normalize_forms)
+
+def normalize_key(key):
+    return " ".join(w for w in (_normalize_forms(w)[0] for w in str(key).split()) if w)
+
 def normalize_dict(raw_dict):
     normalized = {}
     for k, v in raw_dict.items():
-        clean_key = str(k).lower().strip()
+        clean_key = normalize_key(k)
+        if not clean_key: continue
         normalized[clean_key] = v
     return normalized
 
-def load_default_dictionary():
-    global CURRENT_DICTIONARY
+def load_default_dictionary(reload=False):
+    # A compiled dictionary (see compile_dict.py) that is at least as new as
+    # the JSON file is mapped instead of parsing the JSON. On reload, a file
+    # that cannot be read (e.g. one being saved) keeps the current dictionary.
+    if os.path.exists(DEFAULT_COMPILED_DICT_FILENAME):
+        compiled_mtime = os.path.getmtime(DEFAULT_COMPILED_DICT_FILENAME)
+        if not os.path.exists(DEFAULT_DICT_FILENAME) or compiled_mtime >= os.path.getmtime(DEFAULT_DICT_FILENAME):
+            try:
+                set_default_dictionary(compiled_path=DEFAULT_COMPILED_DICT_FILENAME)
+                return
+            except (OSError, ValueError) as e:
+                print(f"Error loading compiled dictionary: {e}")
+                if reload: return
+
     if not os.path.exists(DEFAULT_DICT_FILENAME):
         sample_data = {
             "rauf": "A male name",
@@ -36,33 +232,203 @@ def load_default_dictionary():
             json.dump(sample_data, f, indent=4)
     
     try:
-        with open(DEFAULT_DICT_FILENAME, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            CURRENT_DICTIONARY = normalize_dict(data)
-    except Exception:
-        CURRENT_DICTIONARY = {}
+        with open(DEFAULT_DICT_FILENAME, 'rb') as f:
+            loaded = load_dictionary(f)
+    except Exception as e:
+        if reload:
+            print(f"Error reloading dictionary: {e}")
+            return
+        loaded = DictionaryLoader()
+
+    set_default_dictionary(loaded.entries, matcher=loaded.matcher)
+
+class LRUCache:
+    # Thread-safe LRU mapping bounded by entry count and/or approximate size
+    # in bytes, as reported by the sizeof callable. Entries idle for longer
+    # than ttl seconds expire. on_evict(key, value) is called, outside the
+    # lock, for every entry dropped to stay within budget or by expiry.
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=None, ttl=None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.data = OrderedDict()
+        self.sizes = {}
+        self.touched = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.data and not self._expired(key, time.monotonic())
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        evicted = []
+        with self.lock:
+            if key in self.data and self._expired(key, now):
+                evicted.append((key, self._remove(key)))
+                self.evictions += 1
+            if key not in self.data:
+                self.misses += 1
+                value = default
+            else:
+                self.hits += 1
+                self.touched[key] = now
+                self.data.move_to_end(key)
+                value = self.data[key]
+        self._notify(evicted)
+        return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+            self.data[key] = value
+            self.sizes[key] = size
+            self.touched[key] = time.monotonic()
+            self.total_bytes += size
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def keys(self):
+        with self.lock:
+            return list(self.data)
+
+    def values(self):
+        with self.lock:
+            return list(self.data.values())
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.data: return default
+            return self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.sizes.clear()
+            self.touched.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        self.total_bytes -= self.sizes.pop(key)
+        del self.touched[key]
+        return self.data.pop(key)
+
+    def _expired(self, key, now):
+        return self.ttl is not None and now - self.touched[key] > self.ttl
+
+    def _over_budget(self):
+        if self.max_entries is not None and len(self.data) > self.max_entries: return True
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes: return True
+        return False
+
+    def _evict(self):
+        # The newest entry is kept even if it alone exceeds the byte budget
+        evicted = []
+        now = time.monotonic()
+        while len(self.data) > 1:
+            oldest = next(iter(self.data))
+            if not (self._over_budget() or self._expired(oldest, now)): break
+            evicted.append((oldest, self._remove(oldest)))
+            self.evictions += 1
+        return evicted
+
+    def _notify(self, evicted):
+        if self.on_evict is None: return
+        for key, value in evicted:
+            self.on_evict(key, value)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.data),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+class SQLiteStore:
+    # Key/value store in a local SQLite file, shared by every worker process
+    # on the host. Connections are opened per thread and per process, since
+    # they must not cross a fork.
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS kv ("
+                         "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB, "
+                         "PRIMARY KEY (namespace, key))")
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key):
+        row = self._connection().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return row[0] if row else None
+
+    def put(self, namespace, key, value):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                         (namespace, key, value))
+
+    def delete(self, namespace, key):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def trim(self, namespace, max_rows):
+        # Keeps the max_rows most recently written rows of namespace
+        with self._connection() as conn:
+            conn.execute("DELETE FROM kv WHERE namespace = ? AND rowid NOT IN "
+                         "(SELECT rowid FROM kv WHERE namespace = ? ORDER BY rowid DESC LIMIT ?)",
+                         (namespace, namespace, max_rows))
+
+HASH_RE = re.compile(r'[0-9a-f]{32}')
+
+def is_hash(value):
+    return isinstance(value, str) and HASH_RE.fullmatch(value) is not None
 
 def calculate_hash(content):
     return hashlib.md5(content.encode('utf-8')).hexdigest()
 
-def split_into_pages(text, max_chars=1000):
-    pages = []
+def iter_pages(paragraphs, max_chars=DEFAULT_PAGE_SIZE):
+    # Generator form of split_into_pages: takes an iterable of lines and
+    # yields each page as soon as it is complete.
     current_page = []
     current_len = 0
-    paragraphs = text.split('\n')
-    
+
     for para in paragraphs:
         para = para.strip()
         if not para: continue
         if current_len + len(para) > max_chars and current_page:
-            pages.append("\n".join(current_page))
+            yield "\n".join(current_page)
             current_page = []
             current_len = 0
         if len(para) > max_chars:
-            sentences = re.split(r'(?<=[.!?]) +', para)
+            sentences = SENTENCE_END_RE.split(para)
             for sent in sentences:
                 if current_len + len(sent) > max_chars and current_page:
-                    pages.append(" ".join(current_page))
+                    yield " ".join(current_page)
                     current_page = []
                     current_len = 0
                 current_page.append(sent)
@@ -71,15 +437,1327 @@ def split_into_pages(text, max_chars=1000):
             current_page.append(para)
             current_len += len(para)
     if current_page:
-        pages.append("\n".join(current_page))
-    return pages
+        yield "\n".join(current_page)
+
+def split_into_pages(text, max_chars=DEFAULT_PAGE_SIZE):
+    return list(iter_pages(text.split('\n'), max_chars))
+
+def iter_lines(stream, hasher=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    # Reads a binary stream chunk by chunk, feeding the raw bytes to hasher
+    # (if any) and yielding decoded lines. Only the current line is buffered.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    partial = []
+    final = False
+    while not final:
+        chunk = stream.read(chunk_size)
+        final = not chunk
+        if chunk and hasher: hasher.update(chunk)
+        text = decoder.decode(chunk, final=final)
+        if '\n' not in text:
+            partial.append(text)
+            continue
+        lines = text.split('\n')
+        partial.append(lines[0])
+        yield "".join(partial)
+        yield from lines[1:-1]
+        partial = [lines[-1]]
+    yield "".join(partial)
+
+class PagedText:
+    # Read-only paginated book backed by two files: <prefix>.txt holds the
+    # UTF-8 text of all pages back to back and is memory-mapped, <prefix>.idx
+    # holds the page boundaries as an array of byte offsets. Indexing decodes
+    # only the requested page, and every worker mapping the same book shares
+    # the OS page cache.
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.offsets = array('Q')
+        with open(prefix + '.idx', 'rb') as f:
+            data = f.read()
+        # A book still being written may end in a partly written offset
+        self.offsets.frombytes(data[:len(data) - len(data) % self.offsets.itemsize])
+        with open(prefix + '.txt', 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+
+    @staticmethod
+    def write(prefix, pages):
+        # Streams pages to <prefix>.txt / <prefix>.idx, one page in memory
+        offsets = array('Q', [0])
+        with open(prefix + '.txt', 'wb') as f:
+            for page in pages:
+                f.write(page.encode('utf-8'))
+                offsets.append(f.tell())
+        with open(prefix + '.idx', 'wb') as f:
+            offsets.tofile(f)
+
+    def __len__(self):
+        return max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, page_idx):
+        if page_idx < 0: page_idx += len(self)
+        if not 0 <= page_idx < len(self): raise IndexError(page_idx)
+        return self.data[self.offsets[page_idx]:self.offsets[page_idx + 1]].decode('utf-8')
+
+    def __iter__(self):
+        for page_idx in range(len(self)):
+            yield self[page_idx]
+
+class BoundaryIndex:
+    # Paragraph and sentence boundaries of a book, from which it can be
+    # paginated at any size without looking at the text again. The source
+    # is the book's stripped, non-empty lines joined by '\n'. Sentences are
+    # the pieces iter_pages cuts a long paragraph into, stored as byte spans
+    # of the source (starts / ends) and lengths in characters; paragraph p
+    # holds sentences first[p]:first[p + 1] and has para_chars[p] characters.
+    # The source is bytes, or the path of a .src file that is only opened
+    # while a page is read, so cached indexes hold no file descriptors.
+    ARRAYS = (('first', 'Q'), ('para_chars', 'Q'), ('starts', 'Q'), ('ends', 'Q'), ('chars', 'Q'))
+
+    def __init__(self, source, arrays):
+        self.source = source
+        for (name, _), values in zip(self.ARRAYS, arrays):
+            setattr(self, name, values)
+
+    @classmethod
+    def open(cls, prefix):
+        # <prefix>.src holds the source, <prefix>.bnd the arrays, each
+        # preceded by its length
+        arrays = []
+        with open(prefix + '.bnd', 'rb') as f:
+            for _, typecode in cls.ARRAYS:
+                values = array(typecode)
+                count = array('Q')
+                count.fromfile(f, 1)
+                values.fromfile(f, count[0])
+                arrays.append(values)
+        if not os.path.exists(prefix + '.src'): raise FileNotFoundError(prefix + '.src')
+        return cls(prefix + '.src', arrays)
+
+    def read(self, start, end):
+        # Bytes start:end of the source
+        if not isinstance(self.source, str): return self.source[start:end]
+        with open(self.source, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def __len__(self):
+        return len(self.para_chars)
+
+    def approx_size(self):
+        return 200 + sum(8 * len(getattr(self, name)) for name, _ in self.ARRAYS)
+
+class BoundaryWriter:
+    # Builds a BoundaryIndex from the lines of a book as they are read,
+    # writing the source to a file (or keeping it in memory without one)
+    def __init__(self, src=None):
+        self.src = src
+        self.buffer = bytearray()
+        self.pos = 0
+        self.arrays = [array(typecode) for _, typecode in BoundaryIndex.ARRAYS]
+
+    def add(self, line):
+        para = line.strip()
+        if not para: return
+        first, para_chars, starts, ends, chars = self.arrays
+        if self.pos: self._write(b'\n')
+        first.append(len(starts))
+        para_chars.append(len(para))
+        pos = self.pos
+        cursor = 0
+        for m in SENTENCE_END_RE.finditer(para):
+            size = len(para[cursor:m.start()].encode('utf-8'))
+            starts.append(pos)
+            ends.append(pos + size)
+            chars.append(m.start() - cursor)
+            pos += size + m.end() - m.start()
+            cursor = m.end()
+        starts.append(pos)
+        ends.append(pos + len(para[cursor:].encode('utf-8')))
+        chars.append(len(para) - cursor)
+        self._write(para.encode('utf-8'))
+
+    def record(self, lines):
+        # Passes lines through, adding each one to the index
+        for line in lines:
+            self.add(line)
+            yield line
+
+    def _write(self, data):
+        if self.src: self.src.write(data)
+        else: self.buffer += data
+        self.pos += len(data)
+
+    def finish(self, bnd=None):
+        # Writes the arrays to bnd, or returns the in-memory index
+        self.arrays[0].append(len(self.arrays[2]))
+        if bnd is None: return BoundaryIndex(bytes(self.buffer), self.arrays)
+        for values in self.arrays:
+            array('Q', [len(values)]).tofile(bnd)
+            values.tofile(bnd)
+
+class Layout:
+    # The pages of a book at one page size, computed from its BoundaryIndex
+    # with the same rules as iter_pages: page i is the sentence range
+    # starts[i]:starts[i + 1], whose parts are joined by '\n' or, for a page
+    # cut inside a long paragraph, by ' '. Page text is assembled on access.
+    def __init__(self, index, max_chars):
+        self.index = index
+        self.max_chars = max_chars
+        self.starts = array('Q')
+        self.newline = array('B')
+        first, para_chars, chars = index.first, index.para_chars, index.chars
+        page_start = None
+        length = 0
+        for p in range(len(para_chars)):
+            if length + para_chars[p] > max_chars and page_start is not None:
+                self._add(page_start, 1)
+                page_start = None
+                length = 0
+            if para_chars[p] > max_chars:
+                for sent in range(first[p], first[p + 1]):
+                    if length + chars[sent] > max_chars and page_start is not None:
+                        self._add(page_start, 0)
+                        page_start = None
+                        length = 0
+                    if page_start is None: page_start = sent
+                    length += chars[sent]
+            else:
+                if page_start is None: page_start = first[p]
+                length += para_chars[p]
+        if page_start is not None: self._add(page_start, 1)
+        self.starts.append(len(index.starts))
+        # Source offset of each page's first character, for mapping
+        # positions between layouts
+        self.offsets = array('Q', (index.starts[sent] for sent in self.starts[:-1]))
+
+    def _add(self, start, newline):
+        self.starts.append(start)
+        self.newline.append(newline)
+
+    def __len__(self):
+        return len(self.newline)
+
+    def __getitem__(self, page_idx):
+        if page_idx < 0: page_idx += len(self)
+        if not 0 <= page_idx < len(self): raise IndexError(page_idx)
+        index = self.index
+        sent, end = self.starts[page_idx], self.starts[page_idx + 1]
+        p = bisect.bisect_right(index.first, sent) - 1
+        spans = []
+        while sent < end:
+            while index.first[p + 1] <= sent: p += 1
+            if index.para_chars[p] <= self.max_chars:
+                # Short paragraphs are never split
+                last = index.first[p + 1] - 1
+                spans.append((index.starts[sent], index.ends[last]))
+                sent = last + 1
+            else:
+                spans.append((index.starts[sent], index.ends[sent]))
+                sent += 1
+        # The page's spans are read from the source in one go
+        base = spans[0][0]
+        data = index.read(base, spans[-1][1])
+        return ("\n" if self.newline[page_idx] else " ").join(
+            data[start - base:end - base].decode('utf-8') for start, end in spans)
+
+    def __iter__(self):
+        for page_idx in range(len(self)):
+            yield self[page_idx]
+
+    def page_at(self, offset):
+        # Page holding the given source offset
+        return max(bisect.bisect_right(self.offsets, offset) - 1, 0)
+
+class BookWriter:
+    # Appends the pages of a book being ingested. With a prefix they go to
+    # <prefix>.txt / <prefix>.idx in the PagedText layout, flushed page by
+    # page (text before offset) so that any process can read the finished
+    # pages; without one they are kept in a list. The boundary index is
+    # built from the lines passed through record().
+    def __init__(self, prefix=None):
+        self.prefix = prefix
+        self.pages = []
+        self.count = 0
+        self.index = None
+        if prefix:
+            # 'x' claims the book: only one writer per partial book
+            self.idx = open(prefix + '.idx', 'xb')
+            self.txt = open(prefix + '.txt', 'wb')
+            self.src = open(prefix + '.src', 'wb')
+            self.idx.write(array('Q', [0]).tobytes())
+            self.idx.flush()
+        self.boundaries = BoundaryWriter(self.src if prefix else None)
+
+    def record(self, lines):
+        return self.boundaries.record(lines)
+
+    def append(self, page):
+        if self.prefix:
+            self.txt.write(page.encode('utf-8'))
+            self.txt.flush()
+            self.idx.write(array('Q', [self.txt.tell()]).tobytes())
+            self.idx.flush()
+        else:
+            self.pages.append(page)
+        self.count += 1
+
+    def close(self):
+        if self.prefix:
+            self.txt.close()
+            self.idx.close()
+            self.src.close()
+
+    def complete(self):
+        # Called once every line has been recorded
+        if self.prefix:
+            with open(self.prefix + '.bnd', 'wb') as f:
+                self.boundaries.finish(f)
+        else:
+            self.index = self.boundaries.finish()
+
+def pages_size(pages):
+    if isinstance(pages, PagedText):
+        return sys.getsizeof(pages.offsets) + 200
+    return sys.getsizeof(pages) + sum(sys.getsizeof(p) for p in pages)
+
+BOOK_FILES = ('.idx', '.txt', '.src', '.bnd')
+
+class BookCache:
+    # Paginated books keyed by text hash. With a store_dir, books are written
+    # there once as PagedText files and only open handles are cached, so an
+    # evicted book is reopened transparently on the next access. Without
+    # one, page lists are kept in memory and evicted books are gone.
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None, store_dir=None):
+        self.store_dir = store_dir
+        self.memory = LRUCache(max_entries, max_bytes, pages_size, ttl)
+        self.reloads = 0
+        self.writers = {}  # hash -> BookWriter of books this process is ingesting
+        self.indexes = LRUCache(max_entries, max_bytes, lambda index: index.approx_size(), ttl)
+        self.lock = threading.Lock()
+
+    def _prefix(self, f_hash):
+        # Hashes come from requests and end up in paths: anything but an MD5
+        # digest is refused here, before it can name a file
+        if not is_hash(f_hash): raise ValueError(f"Not a book hash: {f_hash!r}")
+        return os.path.join(self.store_dir, f_hash)
+
+    def _tmp_prefix(self, f_hash):
+        return self._prefix(f_hash) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def _stored(self, f_hash):
+        return is_hash(f_hash) and os.path.exists(self._prefix(f_hash) + '.idx')
+
+    def _store(self, f_hash, pages):
+        # Files are written under a temporary name and renamed into place,
+        # .idx last, so readers never see a partial book.
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_prefix = self._tmp_prefix(f_hash)
+        PagedText.write(tmp_prefix, pages)
+        self._publish(tmp_prefix, f_hash)
+        return PagedText(self._prefix(f_hash))
+
+    def _publish(self, tmp_prefix, f_hash):
+        prefix = self._prefix(f_hash)
+        if self._stored(f_hash):
+            os.remove(tmp_prefix + '.txt')
+            os.remove(tmp_prefix + '.idx')
+            return
+        os.replace(tmp_prefix + '.txt', prefix + '.txt')
+        os.replace(tmp_prefix + '.idx', prefix + '.idx')
+
+    def _partial_prefix(self, f_hash):
+        return self._prefix(f_hash) + '.part'
+
+    def begin(self, f_hash):
+        # Claims f_hash for ingestion and returns a BookWriter, or None if
+        # the book is already stored or being ingested (here or, through its
+        # partial files, by another process).
+        with self.lock:
+            if f_hash in self.memory or f_hash in self.writers: return None
+            if not self.store_dir:
+                writer = self.writers[f_hash] = BookWriter()
+                return writer
+            if self._stored(f_hash): return None
+            os.makedirs(self.store_dir, exist_ok=True)
+            prefix = self._partial_prefix(f_hash)
+            try:
+                if time.time() - os.path.getmtime(prefix + '.idx') < INGEST_STALE_AFTER: return None
+                # Left behind by a writer that died; start over
+                for ext in BOOK_FILES:
+                    if os.path.exists(prefix + ext): os.remove(prefix + ext)
+            except OSError:
+                pass
+            try:
+                writer = self.writers[f_hash] = BookWriter(prefix)
+            except FileExistsError:
+                return None
+            return writer
+
+    def finish(self, f_hash, writer):
+        # Publishes a fully written book: partial files are renamed into
+        # place, .idx last.
+        writer.complete()
+        writer.close()
+        if self.store_dir:
+            prefix = self._prefix(f_hash)
+            for ext in ('.src', '.bnd', '.txt', '.idx'):
+                os.replace(writer.prefix + ext, prefix + ext)
+            pages = PagedText(prefix)
+        else:
+            pages = writer.pages
+            self.indexes.put(f_hash, writer.index)
+        self.memory.put(f_hash, pages)
+        with self.lock:
+            self.writers.pop(f_hash, None)
+        return pages
+
+    def abort(self, f_hash, writer):
+        writer.close()
+        if writer.prefix:
+            for ext in BOOK_FILES:
+                if os.path.exists(writer.prefix + ext): os.remove(writer.prefix + ext)
+        with self.lock:
+            self.writers.pop(f_hash, None)
+
+    def ingesting(self, f_hash):
+        if f_hash in self.writers: return True
+        return bool(self.store_dir) and is_hash(f_hash) and not self._stored(f_hash) \
+            and os.path.exists(self._partial_prefix(f_hash) + '.idx')
+
+    def _partial(self, f_hash):
+        # Pages written so far of a book being ingested; not cached, since
+        # the book keeps growing
+        writer = self.writers.get(f_hash)
+        if writer is not None and not writer.prefix: return writer.pages
+        if not self.store_dir or not is_hash(f_hash): return None
+        try:
+            return PagedText(self._partial_prefix(f_hash))
+        except (OSError, ValueError):
+            return None
+
+    def boundaries(self, f_hash):
+        # BoundaryIndex of a complete book, or None for books stored before
+        # indexes were kept
+        index = self.indexes.get(f_hash)
+        if index is None and self.store_dir and self._stored(f_hash):
+            try:
+                index = BoundaryIndex.open(self._prefix(f_hash))
+            except (OSError, EOFError):
+                return None
+            self.indexes.put(f_hash, index)
+        return index
+
+    def add_boundaries(self, f_hash, lines):
+        # Indexes a stored book that has no boundary index yet
+        if self.boundaries(f_hash) is not None: return
+        if not self.store_dir:
+            writer = BoundaryWriter()
+            for line in lines: writer.add(line)
+            self.indexes.put(f_hash, writer.finish())
+            return
+        tmp_prefix = self._tmp_prefix(f_hash)
+        try:
+            with open(tmp_prefix + '.src', 'wb') as src:
+                writer = BoundaryWriter(src)
+                for line in lines: writer.add(line)
+            with open(tmp_prefix + '.bnd', 'wb') as bnd:
+                writer.finish(bnd)
+            os.replace(tmp_prefix + '.src', self._prefix(f_hash) + '.src')
+            os.replace(tmp_prefix + '.bnd', self._prefix(f_hash) + '.bnd')
+        finally:
+            for ext in ('.src', '.bnd'):
+                if os.path.exists(tmp_prefix + ext): os.remove(tmp_prefix + ext)
+
+    def get(self, f_hash, default=None):
+        # Complete books, or the finished pages of one being ingested
+        if not is_hash(f_hash): return default
+        pages = self.memory.get(f_hash)
+        if pages is None:
+            if not self.store_dir or not self._stored(f_hash):
+                pages = self._partial(f_hash)
+                # The book may have been published in the meantime
+                if pages is None and self.store_dir and self._stored(f_hash): return self.get(f_hash, default)
+                return default if pages is None else pages
+            try:
+                pages = PagedText(self._prefix(f_hash))
+            except (OSError, ValueError):
+                return default
+            touch(self._prefix(f_hash) + '.idx')
+            self.reloads += 1
+            self.memory.put(f_hash, pages)
+        return pages
+
+    def __contains__(self, f_hash):
+        if not is_hash(f_hash): return False
+        if f_hash in self.memory: return True
+        return bool(self.store_dir) and self._stored(f_hash)
+
+    def __getitem__(self, f_hash):
+        pages = self.get(f_hash)
+        if pages is None: raise KeyError(f_hash)
+        return pages
+
+    def __setitem__(self, f_hash, pages):
+        if self.store_dir:
+            pages = PagedText(self._prefix(f_hash)) if self._stored(f_hash) else self._store(f_hash, pages)
+        self.memory.put(f_hash, pages)
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats["reloads"] = self.reloads
+        return stats
+
+class PhraseMatcher:
+    # Word-level tries over the normalized dictionary keys, built once per
+    # dictionary load: an exact index and a secondary index with accents
+    # folded. Each node is a dict of next word -> child node; the translation
+    # of a complete key is stored under the _END marker.
+    _END = object()
+
+    def __init__(self, dictionary):
+        self.exact_root = {}
+        self.folded_root = {}
+        self.copied = 0  # entries of the nodes copied by patches, see patched
+        for key, translation in dictionary.items():
+            self.add(key, translation)
+
+    def add(self, key, translation):
+        # Only while building: inserting a key twice is not the same as
+        # building from the final entries (see DictionaryLoader)
+        words = key.split()
+        if not words: return
+        self._insert(self.exact_root, words, translation, True)
+        folded = [_normalize_forms(w)[1] for w in words]
+        # On collisions (élève / eleve) the unaccented spelling wins
+        self._insert(self.folded_root, folded, translation, folded == words)
+
+    def _insert(self, root, words, translation, overwrite):
+        node = root
+        for word in words:
+            node = node.setdefault(word, {})
+        if overwrite or self._END not in node:
+            node[self._END] = translation
+
+    def _walk(self, node, keys, i):
+        best = (0, None)
+        for j in range(i, len(keys)):
+            node = node.get(keys[j])
+            if node is None: break
+            if self._END in node:
+                best = (j - i + 1, node[self._END])
+        return best
+
+    def match(self, exact, folded, i):
+        # Longest match starting at word i; an exact match wins over an
+        # accent-free one of the same length.
+        length, translation = self._walk(self.exact_root, exact, i)
+        f_length, f_translation = self._walk(self.folded_root, folded, i)
+        if f_length > length:
+            return f_length, f_translation
+        return length, translation
+
+    def patched(self, entries, changed, copy=True):
+        # Matcher for entries, which differ from this matcher's dictionary
+        # only in the changed keys. Only the trie paths of those keys are
+        # copied, the roots included (as TrieOverlays); everything else is
+        # shared, and this matcher stays valid. Without copy, this matcher
+        # is changed in place and returned.
+        if copy:
+            matcher = PhraseMatcher({})
+            matcher.exact_root = TrieOverlay.over(self.exact_root)
+            matcher.folded_root = TrieOverlay.over(self.folded_root)
+            matcher.copied = self.copied
+            copied = set()
+        else:
+            matcher = self
+            copied = None
+        # A folded key is held by its unaccented spelling if there is one,
+        # otherwise by the first key that folds to it
+        folded_keys = {key: fold_key(key) for key in changed}
+        orphans = {f for f in folded_keys.values() if f not in entries}
+        holders = {}
+        if orphans and isinstance(entries, PatchedEntries):
+            for folded in orphans:
+                holder = next(entries.keys_folding_to(folded), None)
+                if holder is not None: holders[folded] = holder
+        elif orphans:
+            for key in entries:
+                # An ASCII key folds to itself, and orphans are not keys
+                if key.isascii(): continue
+                folded = fold_key(key)
+                if folded in orphans and folded not in holders: holders[folded] = key
+        for key, folded in folded_keys.items():
+            matcher._patch(matcher.exact_root, key.split(), entries.get(key, _REMOVED), copied)
+            holder = folded if folded in entries else holders.get(folded)
+            matcher._patch(matcher.folded_root, folded.split(),
+                           entries[holder] if holder is not None else _REMOVED, copied)
+        return matcher
+
+    def _patch(self, root, words, translation, copied):
+        node = root
+        for word in words:
+            child = node.get(word)
+            if child is None:
+                if translation is _REMOVED: return
+                child = {}
+            elif copied is not None and id(child) not in copied:
+                self.copied += len(child)
+                child = dict(child)
+            if copied is not None: copied.add(id(child))
+            node[word] = child
+            node = child
+        if translation is _REMOVED:
+            node.pop(self._END, None)
+        else:
+            node[self._END] = translation
+
+_REMOVED = object()
+
+class TrieOverlay:
+    # Root of a patched trie: the first-word nodes that patches copied, over
+    # the root of the original trie, which is shared and never modified.
+    # Patches of a patch start from a copy of its nodes, so lookups never go
+    # through more than one overlay.
+    def __init__(self, base, nodes=None):
+        self.base = base
+        self.nodes = nodes if nodes is not None else {}
+
+    @classmethod
+    def over(cls, root):
+        if isinstance(root, TrieOverlay): return cls(root.base, dict(root.nodes))
+        return cls(root)
+
+    def get(self, word, default=None):
+        node = self.nodes.get(word)
+        return node if node is not None else self.base.get(word, default)
+
+    def __setitem__(self, word, node):
+        self.nodes[word] = node
+
+class PatchedEntries(Mapping):
+    # Entries of the dictionary base_id with the keys in patch set to new
+    # values or _REMOVED, read through to the base instead of copying it.
+    # Patches of one base share its index of folded keys (see folded_index).
+    def __init__(self, base, patch, base_id, folded_index=None):
+        self.base = base
+        self.base_id = base_id
+        self.folded_index = folded_index if folded_index is not None else [None]
+        self.patch = patch
+        self.size = len(base)
+        for key, value in patch.items():
+            if key in base: self.size -= value is _REMOVED
+            else: self.size += value is not _REMOVED
+
+    def __getitem__(self, key):
+        value = self.patch[key] if key in self.patch else self.base[key]
+        if value is _REMOVED: raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for key in self.base:
+            if key not in self.patch: yield key
+        for key, value in self.patch.items():
+            if value is not _REMOVED: yield key
+
+    def __len__(self):
+        return self.size
+
+    def keys_folding_to(self, folded):
+        # Non-ASCII keys that fold to folded, in iteration order. The index
+        # of the base is built on first use.
+        index = self.folded_index[0]
+        if index is None:
+            index = {}
+            for key in self.base:
+                if not key.isascii(): index.setdefault(fold_key(key), []).append(key)
+            self.folded_index[0] = index
+        for key in index.get(folded, ()):
+            if key not in self.patch: yield key
+        for key, value in self.patch.items():
+            if value is not _REMOVED and not key.isascii() and fold_key(key) == folded: yield key
+
+def patch_record(root_id, patch):
+    # Stored form of a patch against root_id; its MD5 is the patched id
+    items = [[key] if patch[key] is _REMOVED else [key, patch[key]] for key in sorted(patch)]
+    return json.dumps({"root": root_id, "patch": items}, ensure_ascii=False)
+
+def dictionary_hash(dictionary, batch=10000):
+    # MD5 of json.dumps(dictionary, sort_keys=True, ensure_ascii=False),
+    # encoded a batch of entries at a time rather than as one string
+    keys = sorted(dictionary)
+    hasher = hashlib.md5(b'{')
+    for start in range(0, len(keys), batch):
+        part = json.dumps({k: dictionary[k] for k in keys[start:start + batch]}, sort_keys=True, ensure_ascii=False)
+        if start: hasher.update(b', ')
+        hasher.update(part[1:-1].encode('utf-8'))
+    hasher.update(b'}')
+    return hasher.hexdigest()
+
+class CompiledDictionary:
+    # Immutable compiled form of one normalized dictionary. Its id is the
+    # content hash, so equal uploads share one instance and one set of
+    # cached pages.
+    def __init__(self, entries, dict_id=None, matcher=None):
+        self.id = dict_id or dictionary_hash(entries)
+        self.entries = entries
+        self.matcher = matcher or PhraseMatcher(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def items(self):
+        return self.entries.items()
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def patched(self, entries, changed, dict_id=None):
+        return CompiledDictionary(entries, dict_id, self.matcher.patched(entries, changed))
+
+    @property
+    def source(self):
+        # What a pre-tokenization worker needs to rebuild this dictionary
+        return self.entries
+
+    def approx_size(self):
+        # Trie nodes dominate: roughly two dicts per key word. A patch shares
+        # its base's trie except for the paths of the changed keys, whose
+        # copied nodes are counted instead.
+        if isinstance(self.entries, PatchedEntries):
+            return sum(600 + 2 * len(k) + len(str(v)) for k, v in self.entries.patch.items()) + 50 * self.matcher.copied
+        return sum(600 + 2 * len(k) + len(str(v)) for k, v in self.entries.items())
+
+# --- DICTIONARY LOADING ---
+# Uploaded dictionaries are parsed as a stream and each entry is normalized
+# and inserted into the matcher as soon as it is read, so peak memory is the
+# compiled dictionary plus one chunk of input, not the raw parsed JSON and a
+# normalized copy of it. Besides a JSON object, two line formats are read:
+#
+#   .ndjson / .jsonl   one ["term", "translation"] or {"term": "translation"} per line
+#   .tsv               term<TAB>translation per line
+
+JSON_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+JSON_NUMBER_TAIL_RE = re.compile(r'[0-9.eE+-]*')
+
+def iter_json_entries(stream, chunk_size=UPLOAD_CHUNK_SIZE):
+    # Yields (key, value, where) for each member of the top-level JSON
+    # object in a binary stream. Only the unparsed rest of the current chunk
+    # and the member being read are buffered. Raises ValueError on invalid
+    # JSON, like json.load.
+    first = stream.read(chunk_size)
+    # The encoding (and BOM) is told by the first four bytes
+    while 0 < len(first) < 4:
+        chunk = stream.read(chunk_size)
+        if not chunk: break
+        first += chunk
+    decoder = codecs.getincrementaldecoder(json.detect_encoding(first))()
+    parser = json.JSONDecoder()
+    buf = decoder.decode(first, final=not first)
+    pos = 0
+    final = not first
+    state = 'start'
+    key = None
+    while True:
+        pos = JSON_WHITESPACE_RE.match(buf, pos).end()
+        need_more = pos == len(buf)
+        if not need_more:
+            c = buf[pos]
+            if state == 'start':
+                if c != '{': raise ValueError("Expected a JSON object")
+                pos += 1
+                state = 'first'
+            elif state in ('first', 'key'):
+                if c == '}' and state == 'first':
+                    state = 'end'
+                    pos += 1
+                elif c != '"':
+                    raise ValueError(f"Expected a key at character {pos}")
+                else:
+                    try:
+                        key, end = json.decoder.scanstring(buf, pos + 1)
+                        pos = end
+                        state = 'colon'
+                    except ValueError:
+                        if final: raise
+                        need_more = True
+            elif state == 'colon':
+                if c != ':': raise ValueError(f"Expected ':' at character {pos}")
+                pos += 1
+                state = 'value'
+            elif state == 'value':
+                try:
+                    value, end = parser.raw_decode(buf, pos)
+                except ValueError:
+                    if final: raise
+                    need_more = True
+                else:
+                    # A number at the end of the buffer may continue in the
+                    # next chunk, even after a part of it ("0." or "1e")
+                    # that was read as a shorter number
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        complete = final or JSON_NUMBER_TAIL_RE.match(buf, end).end() < len(buf)
+                    else:
+                        complete = final or end < len(buf)
+                    if complete:
+                        yield key, value, key
+                        pos = end
+                        state = 'comma'
+                    else:
+                        need_more = True
+            elif state == 'comma':
+                if c == ',': state = 'key'
+                elif c == '}': state = 'end'
+                else: raise ValueError(f"Expected ',' or '}}' at character {pos}")
+                pos += 1
+            else:
+                raise ValueError(f"Extra data at character {pos}")
+        if need_more:
+            if final:
+                if state == 'end': return
+                raise ValueError("Unexpected end of JSON")
+            chunk = stream.read(chunk_size)
+            final = not chunk
+            buf = buf[pos:] + decoder.decode(chunk, final=final)
+            pos = 0
+
+def iter_ndjson_entries(stream):
+    for n, line in enumerate(iter_lines(stream), 1):
+        if not line.strip(): continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = None
+        if isinstance(item, list) and len(item) == 2:
+            yield item[0], item[1], f"line {n}"
+        elif isinstance(item, dict) and len(item) == 1:
+            yield next(iter(item)), next(iter(item.values())), f"line {n}"
+        else:
+            yield None, None, f"line {n}"
+
+def iter_tsv_entries(stream):
+    for n, line in enumerate(iter_lines(stream), 1):
+        line = line.rstrip('\r')
+        if not line.strip(): continue
+        key, tab, translation = line.partition('\t')
+        if tab: yield key, translation, f"line {n}"
+        else: yield None, None, f"line {n}"
+
+DICTIONARY_FORMATS = {
+    '.json': iter_json_entries,
+    '.ndjson': iter_ndjson_entries,
+    '.jsonl': iter_ndjson_entries,
+    '.tsv': iter_tsv_entries,
+}
+MALFORMED_REPORT_LIMIT = 20
+
+def dictionary_format(filename):
+    # Input format by file extension; JSON unless it is a line format
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext if ext in DICTIONARY_FORMATS else '.json'
+
+class DictionaryLoader:
+    # Normalizes entries one at a time in file order. When several entries
+    # normalize to the same key, the last one in the file wins, and the
+    # matcher equals PhraseMatcher(entries). (normalize_dict on the result
+    # of json.load can differ when a raw key repeats, since json.load keeps
+    # the position of its first occurrence.) Entries whose key normalizes to
+    # nothing, or lines that are not entries, are counted as malformed.
+    def __init__(self, build_matcher=True):
+        self.entries = {}
+        self.matcher = PhraseMatcher({}) if build_matcher else None
+        self.duplicates = set()
+        self.malformed = 0
+        self.malformed_entries = []  # where the first MALFORMED_REPORT_LIMIT were
+
+    def add(self, key, translation, where):
+        clean_key = normalize_key(key) if key is not None else ''
+        if not clean_key:
+            self.malformed += 1
+            if len(self.malformed_entries) < MALFORMED_REPORT_LIMIT: self.malformed_entries.append(str(where))
+            return
+        if clean_key in self.entries: self.duplicates.add(clean_key)
+        self.entries[clean_key] = translation
+        if self.matcher is not None: self.matcher.add(clean_key, translation)
+
+    def finish(self):
+        # A key given more than once keeps its last translation; its trie
+        # paths are rebuilt from the final entries
+        if self.duplicates and self.matcher is not None:
+            self.matcher = self.matcher.patched(self.entries, self.duplicates, copy=False)
+        self.duplicates = set()
+        return self
+
+def load_dictionary(stream, fmt='.json', build_matcher=True):
+    # Raises ValueError (including UnicodeDecodeError) on unreadable input
+    loader = DictionaryLoader(build_matcher)
+    for key, translation, where in DICTIONARY_FORMATS[fmt](stream):
+        loader.add(key, translation, where)
+    return loader.finish()
+
+# --- BINARY DICTIONARIES ---
+# A compiled dictionary file holds the exact and the accent-folded keys as two
+# sorted tables plus a table of JSON-encoded translations:
+#
+#   header   magic, key/value counts, dictionary id (content hash)
+#   tables   for each key table: n + 1 uint64 key offsets and n uint32 value
+#            ids; then n_values + 1 uint64 value offsets
+#   blobs    UTF-8 keys, then translations
+#
+# All offsets are absolute file positions, so the file is queried in place
+# through mmap and shared by every process that maps it.
+
+RLDICT_MAGIC = b'RLDICT1\0'
+RLDICT_HEADER = struct.Struct('<8sIII32s4x')
+
+def _align(pos):
+    return (pos + 7) & ~7
+
+def write_compiled_dictionary(path, entries, dict_id=None):
+    dict_id = dict_id or dictionary_hash(entries)
+    folded = {}
+    for key, translation in entries.items():
+        folded_key = " ".join(_normalize_forms(w)[1] for w in key.split())
+        # On collisions (élève / eleve) the unaccented spelling wins
+        if folded_key == key or folded_key not in folded:
+            folded[folded_key] = translation
+
+    values = []
+    value_ids = {}
+    def value_id(translation):
+        encoded = json.dumps(translation, ensure_ascii=False)
+        if encoded not in value_ids:
+            value_ids[encoded] = len(values)
+            values.append(encoded.encode('utf-8'))
+        return value_ids[encoded]
+
+    tables = []
+    for table in (entries, folded):
+        keys = sorted((k.encode('utf-8'), value_id(v)) for k, v in table.items())
+        tables.append(keys)
+
+    pos = RLDICT_HEADER.size
+    layout = []
+    for keys in tables:
+        offsets_pos = _align(pos)
+        ids_pos = _align(offsets_pos + 8 * (len(keys) + 1))
+        pos = ids_pos + 4 * len(keys)
+        layout.append((offsets_pos, ids_pos))
+    value_offsets_pos = _align(pos)
+    blob_pos = value_offsets_pos + 8 * (len(values) + 1)
+
+    with open(path, 'wb') as f:
+        f.write(RLDICT_HEADER.pack(RLDICT_MAGIC, len(tables[0]), len(tables[1]), len(values),
+                                   dict_id.encode('ascii')))
+        blob_end = blob_pos
+        for keys, (offsets_pos, ids_pos) in zip(tables, layout):
+            offsets = array('Q')
+            for key, _ in keys:
+                offsets.append(blob_end)
+                blob_end += len(key)
+            offsets.append(blob_end)
+            f.write(b'\0' * (offsets_pos - f.tell()))
+            offsets.tofile(f)
+            f.write(b'\0' * (ids_pos - f.tell()))
+            array('I', [vid for _, vid in keys]).tofile(f)
+        offsets = array('Q')
+        for value in values:
+            offsets.append(blob_end)
+            blob_end += len(value)
+        offsets.append(blob_end)
+        f.write(b'\0' * (value_offsets_pos - f.tell()))
+        offsets.tofile(f)
+        for keys in tables:
+            for key, _ in keys:
+                f.write(key)
+        for value in values:
+            f.write(value)
+    return dict_id
+
+def read_compiled_dictionary_id(path):
+    with open(path, 'rb') as f:
+        header = f.read(RLDICT_HEADER.size)
+    if len(header) < RLDICT_HEADER.size: raise ValueError("Not a compiled dictionary")
+    magic, _, _, _, dict_id = RLDICT_HEADER.unpack(header)
+    if magic != RLDICT_MAGIC: raise ValueError("Not a compiled dictionary")
+    return dict_id.decode('ascii')
+
+class MappedDictionary:
+    # A compiled dictionary file opened with mmap and searched in place, so
+    # loading is constant-time and the pages are shared between workers. It
+    # is its own matcher: phrases are grown word by word with a binary search
+    # per step, in the same longest-match order as PhraseMatcher. The header
+    # is always checked against the file size; verify also checks every
+    # table entry, for files that come from outside.
+    def __init__(self, path, dict_id=None, verify=False):
+        self.path = os.path.abspath(path)
+        with open(self.path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < RLDICT_HEADER.size: raise ValueError("Not a compiled dictionary")
+        magic, n_exact, n_folded, n_values, header_id = RLDICT_HEADER.unpack_from(self.data)
+        if magic != RLDICT_MAGIC: raise ValueError("Not a compiled dictionary")
+        self.header_id = header_id.decode('ascii')
+        self.id = dict_id or self.header_id
+        self.matcher = self
+        self.uses = count(1)  # requests served, see DictionaryRegistry.hot
+        view = memoryview(self.data)
+        pos = RLDICT_HEADER.size
+        self.tables = []
+        for n in (n_exact, n_folded):
+            offsets_pos = _align(pos)
+            ids_pos = _align(offsets_pos + 8 * (n + 1))
+            pos = ids_pos + 4 * n
+            if pos > len(self.data): raise ValueError("Truncated compiled dictionary")
+            self.tables.append((view[offsets_pos:ids_pos].cast('Q')[:n + 1],
+                                view[ids_pos:pos].cast('I'), n))
+        value_offsets_pos = _align(pos)
+        blob_pos = value_offsets_pos + 8 * (n_values + 1)
+        if blob_pos > len(self.data): raise ValueError("Truncated compiled dictionary")
+        self.value_offsets = view[value_offsets_pos:blob_pos].cast('Q')
+        if verify: self._verify(blob_pos, n_values)
+        # Common words are probed over and over; remember recent answers
+        self._probes = lru_cache(maxsize=MAPPED_DICT_PROBE_CACHE_SIZE)(self._probe)
+
+    def _verify(self, blob_pos, n_values):
+        # Offsets must increase within the blobs, value ids must be in range,
+        # and keys and values must decode; raises ValueError otherwise
+        size = len(self.data)
+        for offsets, ids, n in self.tables + [(self.value_offsets, None, n_values)]:
+            if offsets[0] < blob_pos or offsets[n] > size: raise ValueError("Offset out of range")
+            if any(offsets[i] > offsets[i + 1] for i in range(n)): raise ValueError("Offsets out of order")
+            if ids is not None and n and max(ids) >= n_values: raise ValueError("Value id out of range")
+        for table in self.tables:
+            for idx in range(table[2]):
+                self._key(table, idx).decode('utf-8')
+        for vid in range(n_values):
+            json.loads(self.data[self.value_offsets[vid]:self.value_offsets[vid + 1]].decode('utf-8'))
+
+    def __len__(self):
+        return self.tables[0][2]
+
+    def items(self):
+        table = self.tables[0]
+        for idx in range(table[2]):
+            yield self._key(table, idx).decode('utf-8'), self._value(table, idx)
+
+    def get(self, key, default=None):
+        idx, _ = self._probes(0, key.encode('utf-8'))
+        return self._value(self.tables[0], idx) if idx >= 0 else default
+
+    @property
+    def source(self):
+        return self.path
+
+    def approx_size(self):
+        return 1000
+
+    def _key(self, table, idx):
+        offsets = table[0]
+        return self.data[offsets[idx]:offsets[idx + 1]]
+
+    def _lower_bound(self, table, target):
+        lo, hi = 0, table[2]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(table, mid) < target: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def _value(self, table, idx):
+        vid = table[1][idx]
+        return json.loads(self.data[self.value_offsets[vid]:self.value_offsets[vid + 1]].decode('utf-8'))
+
+    def _probe(self, table_no, phrase):
+        # Returns (index of phrase or -1, whether longer keys extend it).
+        # Keys extending a phrase sort right after it, because the separating
+        # space is lower than any character a normalized word contains.
+        table = self.tables[table_no]
+        idx = self._lower_bound(table, phrase)
+        found = -1
+        if idx < table[2] and self._key(table, idx) == phrase:
+            found = idx
+            idx += 1
+        extends = idx < table[2] and self._key(table, idx).startswith(phrase + b' ')
+        return found, extends
+
+    def _walk(self, table_no, keys, i):
+        best = (0, -1)
+        phrase = b''
+        for j in range(i, len(keys)):
+            if not keys[j]: break
+            phrase = phrase + b' ' + keys[j].encode('utf-8') if phrase else keys[j].encode('utf-8')
+            found, extends = self._probes(table_no, phrase)
+            if found >= 0: best = (j - i + 1, found)
+            if not extends: break
+        if best[0]: return best[0], self._value(self.tables[table_no], best[1])
+        return 0, None
+
+    def match(self, exact, folded, i):
+        length, translation = self._walk(0, exact, i)
+        f_length, f_translation = self._walk(1, folded, i)
+        if f_length > length:
+            return f_length, f_translation
+        return length, translation
+
+class DictionaryRegistry:
+    # Content-addressed registry of compiled dictionaries, bounded by an LRU.
+    # With a store, normalized entries are kept there so evicted dictionaries
+    # (or ones registered by another worker) can be compiled again; binary
+    # dictionaries are kept as files in store_dir and simply mapped again.
+    def __init__(self, max_entries=None, max_bytes=None, store=None, store_dir=None, persist=False):
+        self.compiled = LRUCache(max_entries, max_bytes, lambda d: d.approx_size())
+        self.store = store
+        self.store_dir = store_dir
+        self.persist = persist
+        # Writes binary copies of dictionaries to store_dir, one at a time:
+        # every new one with persist, otherwise only those compiled_file asks for
+        self.persist_pool = ThreadPoolExecutor(max_workers=1) if store_dir else None
+        # Compiles hot mapped dictionaries, one at a time
+        self.compile_pool = ThreadPoolExecutor(max_workers=1)
+
+    def register(self, entries, matcher=None):
+        return self._register(entries, lambda dict_id: CompiledDictionary(entries, dict_id, matcher))
+
+    def register_patch(self, base, changes):
+        # changes maps keys to new translations or _REMOVED. The result is
+        # kept as its changes against a root, the last full dictionary, and
+        # its id is derived from the root id and those changes, so neither
+        # costs time in the size of the dictionary. Past PATCH_COMPACT_SIZE
+        # changes it is registered as a full dictionary instead.
+        if isinstance(base, MappedDictionary): base = self.compile(base)
+        if isinstance(base.entries, PatchedEntries):
+            root_id, root, patch = base.entries.base_id, base.entries.base, dict(base.entries.patch)
+            folded_index = base.entries.folded_index
+        else:
+            root_id, root, patch = base.id, base.entries, {}
+            folded_index = None
+        for key, value in changes.items():
+            if root.get(key, _REMOVED) == value: patch.pop(key, None)
+            else: patch[key] = value
+        if len(patch) > PATCH_COMPACT_SIZE:
+            entries = dict(PatchedEntries(root, patch, root_id).items())
+            # A fresh trie, rather than overlays that keep growing
+            return self._register(entries, lambda dict_id: CompiledDictionary(entries, dict_id))
+        record = patch_record(root_id, patch)
+        dict_id = hashlib.md5(record.encode('utf-8')).hexdigest() if patch else root_id
+        dictionary = self.compiled.get(dict_id)
+        if dictionary is None:
+            entries = PatchedEntries(root, patch, root_id, folded_index) if patch else root
+            dictionary = base.patched(entries, changes, dict_id)
+            if patch: self._store_patch(dict_id, record)
+            self.compiled.put(dict_id, dictionary)
+        return dictionary
+
+    def compile(self, dictionary):
+        # Replaces a mapped dictionary by a compiled copy under the same id,
+        # which matches faster and has entries and a trie for patches to share
+        compiled = self.compiled.get(dictionary.id)
+        if not isinstance(compiled, CompiledDictionary):
+            compiled = CompiledDictionary(dict(dictionary.items()), dictionary.id)
+            self.compiled.put(dictionary.id, compiled)
+        return compiled
+
+    def _store_patch(self, dict_id, record):
+        if self.store is not None: self.store.put('patches', dict_id, record)
+        path = self._patch_path(dict_id)
+        if not self.persist or path is None: return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f: f.write(record)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error saving dictionary {dict_id}: {e}")
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+
+    def _load_patch(self, dict_id):
+        # Rebuilds a patched dictionary from its root and stored changes
+        record = self.store.get('patches', dict_id) if self.store is not None else None
+        path = self._patch_path(dict_id)
+        if record is None and path is not None and os.path.exists(path):
+            with open(path, encoding='utf-8') as f: record = f.read()
+            touch(path)
+        if record is None: return None
+        data = json.loads(record)
+        root = self.get(data["root"])
+        if root is None: return None
+        changes = {item[0]: item[1] if len(item) > 1 else _REMOVED for item in data["patch"]}
+        return self.register_patch(root, changes)
+
+    def _register(self, entries, build):
+        dict_id = dictionary_hash(entries)
+        dictionary = self.compiled.get(dict_id)
+        if dictionary is None:
+            if self.store is not None:
+                self.store.put('dictionaries', dict_id, json.dumps(entries, ensure_ascii=False))
+            dictionary = build(dict_id)
+            self.compiled.put(dict_id, dictionary)
+            if self.persist and self.persist_pool is not None:
+                self.persist_pool.submit(self._persist, dictionary)
+        return dictionary
+
+    def _persist(self, dictionary):
+        # Returns the path of the binary copy, or None if it cannot be written.
+        # Until the file is in place, get() finds the dictionary in memory.
+        path = self._compiled_path(dictionary.id)
+        if path is None or os.path.exists(path): return path
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            write_compiled_dictionary(tmp_path, dictionary.entries, dictionary.id)
+            os.replace(tmp_path, path)
+            return path
+        except OSError as e:
+            print(f"Error saving dictionary {dictionary.id}: {e}")
+            return None
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+
+    def compiled_file(self, dictionary):
+        # Future of the path of a binary copy of dictionary (None without a
+        # store_dir), which other processes can map instead of receiving
+        # the entries
+        if isinstance(dictionary, MappedDictionary) or self.persist_pool is None:
+            future = Future()
+            future.set_result(dictionary.path if isinstance(dictionary, MappedDictionary) else None)
+            return future
+        return self.persist_pool.submit(self._persist, dictionary)
+
+    def register_compiled(self, path):
+        # Maps a trusted local binary dictionary under the id in its header
+        dict_id = read_compiled_dictionary_id(path)
+        dictionary = self.compiled.get(dict_id)
+        if dictionary is None:
+            dictionary = MappedDictionary(path, dict_id)
+            self.compiled.put(dict_id, dictionary)
+        return dictionary
+
+    def ingest_compiled(self, stream):
+        # Uploaded binary dictionaries are identified by the MD5 of the file
+        # rather than the id in their header, which cannot be trusted.
+        if not self.store_dir: raise ValueError("Binary dictionaries are disabled")
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = os.path.join(self.store_dir, f"upload.{os.getpid()}.{threading.get_ident()}.tmp")
+        hasher = hashlib.md5()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    f.write(chunk)
+            dict_id = hasher.hexdigest()
+            MappedDictionary(tmp_path, dict_id, verify=True)
+            os.replace(tmp_path, self._compiled_path(dict_id))
+        finally:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+        return self.get(dict_id)
+
+    def _compiled_path(self, dict_id):
+        if not self.store_dir or not is_hash(dict_id): return None
+        return os.path.join(self.store_dir, dict_id + '.rldict')
+
+    def _patch_path(self, dict_id):
+        if not self.store_dir or not is_hash(dict_id): return None
+        return os.path.join(self.store_dir, dict_id + '.patch')
+
+    def hot(self, dictionary):
+        # Counts a request for a mapped dictionary; True for the one request
+        # after which it should be compiled. Only copies persisted from other
+        # dictionaries qualify: an uploaded file is stored under the MD5 of
+        # the file, which is never the id in its header.
+        if MAPPED_DICT_RECOMPILE_AFTER is None or dictionary.header_id != dictionary.id: return False
+        if not self.store_dir or os.path.dirname(dictionary.path) != os.path.abspath(self.store_dir): return False
+        return next(dictionary.uses) == MAPPED_DICT_RECOMPILE_AFTER
+
+    def get(self, dict_id):
+        dictionary = self.compiled.get(dict_id)
+        if dictionary is None: dictionary = self._load(dict_id)
+        if isinstance(dictionary, MappedDictionary) and self.hot(dictionary):
+            self.compile_pool.submit(self.compile, dictionary)
+        return dictionary
+
+    def _load(self, dict_id):
+        path = self._compiled_path(dict_id)
+        if path is not None and os.path.exists(path):
+            try:
+                dictionary = MappedDictionary(path, dict_id)
+            except (OSError, ValueError):
+                return None
+            touch(path)
+        elif self.store is not None:
+            data = self.store.get('dictionaries', dict_id)
+            if data is None: return self._load_patch(dict_id)
+            dictionary = CompiledDictionary(json.loads(data), dict_id)
+        else:
+            return self._load_patch(dict_id)
+        self.compiled.put(dict_id, dictionary)
+        return dictionary
+
+    def stats(self):
+        return self.compiled.stats()
+
+def set_default_dictionary(entries=None, compiled_path=None, matcher=None):
+    # The default dictionary is held here as well, so it is never evicted.
+    # It is compiled first and then published by rebinding the name, so
+    # readers see either the old or the new one, never a mix.
+    global DEFAULT_DICTIONARY
+    if compiled_path:
+        DEFAULT_DICTIONARY = DICTIONARIES.register_compiled(compiled_path)
+    else:
+        DEFAULT_DICTIONARY = DICTIONARIES.register(entries, matcher)
+
+# --- DEFAULT DICTIONARY RELOAD ---
+# Dictionaries are immutable once compiled, so a request that takes one
+# snapshot (default_dictionary() or request_dictionary()) and passes it down
+# tokenizes, caches and tags every page with the same dictionary and id. A
+# changed dictionary.json is compiled on a background thread while requests
+# keep using the current one; in-flight requests finish with their snapshot.
 
-def tokenize_greedy(text):
+DICTIONARY_RELOAD = {"mtimes": None, "checked": 0, "pending": None}
+DICTIONARY_RELOAD_LOCK = threading.Lock()
+DICTIONARY_RELOAD_POOL = ThreadPoolExecutor(max_workers=1)
+
+def default_dictionary_mtimes():
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None
+                 for path in (DEFAULT_DICT_FILENAME, DEFAULT_COMPILED_DICT_FILENAME))
+
+def default_dictionary():
+    # Current default dictionary; starts a reload if its files have changed
+    state = DICTIONARY_RELOAD
+    now = time.monotonic()
+    if DICTIONARY_CHECK_INTERVAL is not None and now - state["checked"] >= DICTIONARY_CHECK_INTERVAL:
+        # Only one request checks; the others go on with the current dictionary
+        if DICTIONARY_RELOAD_LOCK.acquire(blocking=False):
+            try:
+                state["checked"] = now
+                pending = state["pending"]
+                mtimes = default_dictionary_mtimes()
+                if mtimes != state["mtimes"] and (pending is None or pending.done()):
+                    state["mtimes"] = mtimes
+                    state["pending"] = DICTIONARY_RELOAD_POOL.submit(reload_default_dictionary)
+            finally:
+                DICTIONARY_RELOAD_LOCK.release()
+    return DEFAULT_DICTIONARY
+
+def reload_default_dictionary():
+    old_id = DEFAULT_DICTIONARY.id
+    load_default_dictionary(reload=True)
+    if DEFAULT_DICTIONARY.id != old_id: warm_default_book()
+
+def tokenize_greedy(text, dictionary=None):
     # Mark newlines
     text = text.replace('\n', ' ||BR|| ')
     text = re.sub(r'\s+', ' ', text)
     words = text.split(' ')
-    
+
+    # Newline markers never match, so phrases cannot span them
+    forms = [(None, None) if w == '||BR||' else normalize_word(w) for w in words]
+    exact = [f[0] for f in forms]
+    folded = [f[1] for f in forms]
+    matcher = (DEFAULT_DICTIONARY if dictionary is None else dictionary).matcher
+
     tokens = []
     n = len(words)
     i = 0
@@ -89,100 +1767,1021 @@ def tokenize_greedy(text):
             i += 1
             continue
 
-        match_found = False
-        for length in range(min(5, n - i), 0, -1):
-            phrase_segment = words[i : i + length]
-            if '||BR||' in phrase_segment: continue
-            
-            phrase_str = " ".join(phrase_segment)
-            # Basic cleanup
-            clean_key = re.sub(r'[^\w\s]', '', phrase_str).lower().strip()
-            
-            # LOGIC CHANGE: Check exact match first, then fallback to accent-free
-            found_key = None
-            if clean_key in CURRENT_DICTIONARY:
-                found_key = clean_key
-            else:
-                # Remove accents (e.g. demandés -> demandes)
-                normalized = unicodedata.normalize('NFD', clean_key)
-                no_accent_key = "".join([c for c in normalized if unicodedata.category(c) != 'Mn'])
-                if no_accent_key in CURRENT_DICTIONARY:
-                    found_key = no_accent_key
-
-            if found_key:
-                tokens.append({
-                    "text": phrase_str, 
-                    "clickable": True, 
-                    "translation": CURRENT_DICTIONARY[found_key]
-                })
-                i += length
-                match_found = True
-                break
-                
-        if not match_found:
+        # Punctuation-only words around a phrase stay attached to it
+        start = i
+        while start < n and exact[start] == '': start += 1
+        length, translation = matcher.match(exact, folded, start) if start < n else (0, None)
+        if length:
+            end = start + length
+            while end < n and exact[end] == '': end += 1
+            tokens.append({
+                "text": " ".join(words[i : end]),
+                "clickable": True,
+                "translation": translation
+            })
+            i = end
+        else:
             tokens.append({"text": words[i], "clickable": False, "translation": None})
             i += 1
     return tokens
 
+def tokens_size(tokens):
+    # Rough in-memory footprint of a token list
+    size = 0
+    for t in tokens:
+        size += 200 + len(t["text"])
+        # Translations can be any JSON value
+        translation = t.get("translation")
+        if translation is not None: size += len(translation) if isinstance(translation, str) else len(str(translation))
+    return size
+
+def page_cache_size(value):
+    # PAGE_CACHE holds token lists and encoded page responses
+    if isinstance(value, dict): return 200 + sum(len(body) for body in value.values())
+    return tokens_size(value)
+
+PAGE_CACHE = LRUCache(PAGE_CACHE_MAX_ENTRIES, PAGE_CACHE_MAX_BYTES, page_cache_size)
+FILE_CACHE = BookCache(FILE_CACHE_MAX_ENTRIES, FILE_CACHE_MAX_BYTES, FILE_CACHE_TTL, BOOK_STORE_DIR)
+STORE = SQLiteStore(SHARED_STORE_PATH) if SHARED_STORE_PATH else None
+PAGE_STORE = SQLiteStore(PAGE_STORE_PATH) if PAGE_STORE_PATH else None
+DICTIONARIES = DictionaryRegistry(DICTIONARY_REGISTRY_MAX_ENTRIES, DICTIONARY_REGISTRY_MAX_BYTES,
+                                  STORE, DICT_STORE_DIR, PERSIST_DICTIONARIES)
+# Empty until start_up() loads dictionary.json; not registered, so importing
+# the module writes nothing to the stores
+DEFAULT_DICTIONARY = CompiledDictionary({}, dictionary_hash({}))
+
+# Compact wire format (version 2): token texts and a parallel array of refs,
+# where a ref is an index into the page's table of unique translations, or
+# one of the markers below. The default (version 1) is one object per token.
+TOKEN_PLAIN = -1
+TOKEN_NEWLINE = -2
+
+def compact_tokens(tokens):
+    texts = []
+    refs = []
+    translations = []
+    index = {}
+    for t in tokens:
+        texts.append(t["text"])
+        if t.get("newline"):
+            refs.append(TOKEN_NEWLINE)
+        elif not t["clickable"]:
+            refs.append(TOKEN_PLAIN)
+        else:
+            translation = t["translation"]
+            # JSON lists and objects are unhashable; numbers and booleans
+            # would collide with each other (1 == True)
+            key = translation if isinstance(translation, str) else (json.dumps(translation, sort_keys=True),)
+            ref = index.get(key)
+            if ref is None:
+                ref = index[key] = len(translations)
+                translations.append(translation)
+            refs.append(ref)
+    return {"v": 2, "text": texts, "ref": refs, "translations": translations}
+
+def format_tokens(tokens, version):
+    return compact_tokens(tokens) if version == 2 else tokens
+
+def get_page_tokens(f_hash, page_idx, page_text, dictionary):
+    key = (f_hash, page_idx, dictionary.id)
+    tokens = PAGE_CACHE.get(key)
+    if tokens is None:
+        tokens = stored_page_tokens(key)
+        if tokens is None:
+            tokens = tokenize_greedy(page_text, dictionary)
+            store_page_tokens(key, tokens)
+        PAGE_CACHE.put(key, tokens)
+    return tokens
+
+def page_store_key(key):
+    # Tokens depend on the code as well, hence PAGE_FORMAT_VERSION
+    return f"{key[0]}/{key[1]}/{key[2]}/{PAGE_FORMAT_VERSION}"
+
+def stored_page_tokens(key):
+    if PAGE_STORE is None: return None
+    data = PAGE_STORE.get('pages', page_store_key(key))
+    return json.loads(data) if data is not None else None
+
+def store_page_tokens(key, tokens, store=None):
+    store = store if store is not None else PAGE_STORE
+    if store is None: return
+    try:
+        store.put('pages', page_store_key(key), json.dumps(tokens, ensure_ascii=False, separators=(',', ':')))
+    except sqlite3.Error as e:
+        print(f"Error storing page {key}: {e}")
+
+# --- LAYOUTS ---
+# Pages at sizes other than DEFAULT_PAGE_SIZE are laid out from the book's
+# boundary index on first use. Throughout the page and index caches a book
+# at another size is identified as "<hash>.<size>".
+
+LAYOUTS = LRUCache(LAYOUT_CACHE_MAX_ENTRIES)
+
+def get_layout(f_hash, page_size):
+    key = (f_hash, page_size)
+    layout = LAYOUTS.get(key)
+    if layout is None:
+        index = FILE_CACHE.boundaries(f_hash)
+        if index is None: return None
+        layout = Layout(index, page_size)
+        LAYOUTS.put(key, layout)
+    return layout
+
+def book_id(f_hash, page_size):
+    return f_hash if page_size == DEFAULT_PAGE_SIZE else f"{f_hash}.{page_size}"
+
+def book_pages(book):
+    f_hash, _, page_size = book.partition('.')
+    if not page_size: return FILE_CACHE.get(f_hash)
+    return get_layout(f_hash, int(page_size))
+
+# --- CACHEABLE PAGE RESPONSES ---
+# A page is fully determined by the book hash, page number, dictionary id and
+# wire format, so its ETag is derived from those alone and a conditional
+# request is answered without opening the book. Encoded bodies (plain, gzip
+# and, if the brotli module is installed, br) are kept in PAGE_CACHE under
+# (hash, page, dictionary id, format), next to the tokens.
+
+PAGE_ETAG_SALT = hashlib.md5(json.dumps([PAGE_FORMAT_VERSION, NORMALIZATION], sort_keys=True).encode('utf-8')).hexdigest()[:8]
+PAGE_ENCODINGS = ('br', 'gzip')
+
+def page_etag(f_hash, page_idx, dict_id, version):
+    return hashlib.md5(f"{PAGE_ETAG_SALT}:{f_hash}:{page_idx}:{dict_id}:{version}".encode('utf-8')).hexdigest()
+
+def gzip_bytes(data):
+    # gzip header without a timestamp, so every worker produces the same bytes
+    compressor = zlib.compressobj(PAGE_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+def encode_page(page_idx, tokens, version):
+    body = json.dumps({"page_idx": page_idx, "tokens": format_tokens(tokens, version)},
+                      ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return encode_body(body)
+
+def encode_body(body):
+    encoded = {"identity": body}
+    compressed = gzip_bytes(body)
+    if len(compressed) < len(body): encoded["gzip"] = compressed
+    if brotli is not None:
+        compressed = brotli.compress(body, quality=PAGE_BROTLI_QUALITY)
+        if len(compressed) < len(body): encoded["br"] = compressed
+    return encoded
+
+# --- BACKGROUND PRE-TOKENIZATION ---
+# Tasks carry the path of a binary copy of the dictionary and of the book's
+# files with a list of page numbers, so neither the dictionary nor the text
+# is pickled with every task; each worker process maps a dictionary once and
+# keeps the last few it has seen. Without a DICT_STORE_DIR or BOOK_STORE_DIR
+# there are no such files and tasks carry the entries or page texts.
+# With a page store, workers write the tokens there and return nothing.
+
+_WORKER_DICTIONARIES = LRUCache(max_entries=4)
+_WORKER_STORES = {}  # page store path -> SQLiteStore opened in this worker
+
+def _pretokenize_chunk(dict_id, source, book, indices, store_path=None):
+    dictionary = _WORKER_DICTIONARIES.get(dict_id)
+    if dictionary is None:
+        if not isinstance(source, str):
+            dictionary = CompiledDictionary(source, dict_id)
+        else:
+            dictionary = MappedDictionary(source, dict_id)
+        _WORKER_DICTIONARIES.put(dict_id, dictionary)
+    pages = PagedText(book) if isinstance(book, str) else book
+    results = [tokenize_greedy(pages[idx], dictionary) for idx in indices]
+    if store_path is None: return results
+    store = _WORKER_STORES.get(store_path)
+    if store is None: store = _WORKER_STORES[store_path] = SQLiteStore(store_path)
+    f_hash = os.path.basename(book)
+    for idx, tokens in zip(indices, results):
+        store_page_tokens((f_hash, idx, dict_id), tokens, store)
+    return None
+
+def pretokenize_fits(pages, count):
+    # Whether count tokenized pages of this book fit in PAGE_CACHE
+    if PAGE_CACHE_MAX_ENTRIES is not None and count > PAGE_CACHE_MAX_ENTRIES: return False
+    if PAGE_CACHE_MAX_BYTES is None: return True
+    size = pages.offsets[-1] if isinstance(pages, PagedText) else sum(len(p) for p in pages)
+    return size * PRETOKENIZE_BYTES_PER_CHAR <= PAGE_CACHE_MAX_BYTES
+
+PRETOKENIZE_POOL = {"executor": None}
+PRETOKENIZE_JOBS = LRUCache(max_entries=256)  # (hash, dictionary id) -> progress
+PRETOKENIZE_LOCK = threading.Lock()
+
+def _pretokenize_executor():
+    with PRETOKENIZE_LOCK:
+        if PRETOKENIZE_POOL["executor"] is None:
+            PRETOKENIZE_POOL["executor"] = ProcessPoolExecutor(max_workers=PRETOKENIZE_WORKERS)
+        return PRETOKENIZE_POOL["executor"]
+
+def start_pretokenize(f_hash, pages, dictionary):
+    # Tokenizes every page of a book not yet in PAGE_CACHE across the worker
+    # pool. get_page keeps tokenizing on demand whatever is not done yet.
+    if not PRETOKENIZE: return None
+    job_key = (f_hash, dictionary.id)
+    job = PRETOKENIZE_JOBS.get(job_key)
+    if job is not None and job["state"] in ("running", "done"): return job
+
+    todo = [idx for idx in range(len(pages)) if (f_hash, idx, dictionary.id) not in PAGE_CACHE]
+    # Stored books are read by the workers; a stored page needs its hash
+    stored = isinstance(pages, PagedText) and os.path.basename(pages.prefix) == f_hash
+    store_path = PAGE_STORE_PATH if PAGE_STORE is not None and stored else None
+    if todo and store_path is None and not pretokenize_fits(pages, len(todo)):
+        job = {"hash": f_hash, "dictionary": dictionary.id, "total": len(pages),
+               "done": len(pages) - len(todo), "failed": 0, "state": "skipped"}
+        PRETOKENIZE_JOBS.put(job_key, job)
+        return job
+    job = {"hash": f_hash, "dictionary": dictionary.id, "total": len(pages),
+           "done": len(pages) - len(todo), "failed": 0,
+           "state": "running" if todo else "done"}
+    PRETOKENIZE_JOBS.put(job_key, job)
+    if not todo: return job
+
+    def on_done(future, chunk):
+        with PRETOKENIZE_LOCK:
+            if future.exception() is not None:
+                job["failed"] += len(chunk)
+            else:
+                # With a page store the worker has written the tokens already
+                for idx, tokens in zip(chunk, future.result() or ()):
+                    PAGE_CACHE.put((f_hash, idx, dictionary.id), tokens)
+                    store_page_tokens((f_hash, idx, dictionary.id), tokens)
+                job["done"] += len(chunk)
+            if job["done"] + job["failed"] >= job["total"]:
+                job["state"] = "done" if not job["failed"] else "failed"
+
+    def submit(compiled):
+        source = (compiled.exception() is None and compiled.result()) or dictionary.source
+        executor = _pretokenize_executor()
+        for start in range(0, len(todo), PRETOKENIZE_CHUNK):
+            chunk = todo[start:start + PRETOKENIZE_CHUNK]
+            book = pages.prefix if stored else {idx: pages[idx] for idx in chunk}
+            future = executor.submit(_pretokenize_chunk, dictionary.id, source, book, chunk, store_path)
+            future.add_done_callback(lambda f, chunk=chunk: on_done(f, chunk))
+
+    # Chunks are submitted once the dictionary's binary copy is written
+    DICTIONARIES.compiled_file(dictionary).add_done_callback(submit)
+    return job
+
+# --- BACKGROUND INGESTION ---
+# /upload_text copies the upload to a temporary file while hashing it and
+# returns a job at once; a thread then paginates the copy through a
+# BookWriter. Job progress lives in this process, but the finished pages are
+# readable from any worker, which also reports the progress of a book by
+# hash from its partial files.
+
+INGEST_POOL = ThreadPoolExecutor(max_workers=INGEST_WORKERS)
+INGEST_JOBS = LRUCache(max_entries=256)  # job id -> progress
+
+def book_status(f_hash):
+    # Progress of a book known only by its hash; None if there is no such book
+    pages = FILE_CACHE.get(f_hash)
+    if pages is None: return None
+    done = not FILE_CACHE.ingesting(f_hash)
+    return {"job": None, "hash": f_hash, "state": "done" if done else "running",
+            "ready_pages": len(pages), "total_pages": len(pages) if done else None,
+            "bytes": None, "bytes_done": None, "error": None}
+
+def start_ingest(stream, dictionary=None, max_chars=DEFAULT_PAGE_SIZE):
+    # Returns the new job, or the status of the book if it is already
+    # stored or being ingested
+    spool = tempfile.TemporaryFile()
+    hasher = hashlib.md5()
+    size = 0
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk: break
+        hasher.update(chunk)
+        spool.write(chunk)
+        size += len(chunk)
+    f_hash = hasher.hexdigest()
+    writer = FILE_CACHE.begin(f_hash)
+    if writer is None:
+        status = book_status(f_hash)
+        # Otherwise another writer has just given up on this book
+        if status is None: writer = FILE_CACHE.begin(f_hash)
+    if writer is None:
+        spool.close()
+        if status is not None and dictionary is not None and status["state"] == "done":
+            start_pretokenize(f_hash, FILE_CACHE.get(f_hash), dictionary)
+        return status
+    job = {"job": uuid.uuid4().hex, "hash": f_hash, "state": "running", "ready_pages": 0,
+           "total_pages": None, "bytes": size, "bytes_done": 0, "error": None}
+    INGEST_JOBS.put(job["job"], job)
+    INGEST_POOL.submit(_ingest, job, spool, writer, dictionary, max_chars)
+    return job
+
+def _ingest(job, spool, writer, dictionary, max_chars):
+    f_hash = job["hash"]
+    try:
+        spool.seek(0)
+        for page in iter_pages(writer.record(iter_lines(spool)), max_chars):
+            writer.append(page)
+            job["ready_pages"] = writer.count
+            job["bytes_done"] = spool.tell()
+        pages = FILE_CACHE.finish(f_hash, writer)
+        job["total_pages"] = len(pages)
+        job["bytes_done"] = job["bytes"]
+        job["state"] = "done"
+    except Exception as e:
+        FILE_CACHE.abort(f_hash, writer)
+        job["error"] = "Text must be UTF-8" if isinstance(e, UnicodeDecodeError) else str(e)
+        job["state"] = "failed"
+        return
+    finally:
+        spool.close()
+    if dictionary is not None: start_pretokenize(f_hash, pages, dictionary)
+
+# --- STORE SWEEP ---
+# Stored books and dictionaries are files named after their hash. Opening
+# one touches it, and the sweep touches whatever this process holds, so a
+# file's mtime tells when it was last used.
+
+STORE_SWEEP = {"checked": 0}
+STORE_SWEEP_POOL = ThreadPoolExecutor(max_workers=1)
+
+def touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def sweep_dir(directory, max_bytes, keep):
+    # Removes the items (all files of one hash) unused for STORE_TTL, then
+    # the least recently used until the directory is under max_bytes; items
+    # in keep are touched instead. Returns the number of items removed.
+    if not directory or not os.path.isdir(directory): return 0
+    items = {}
+    for name in os.listdir(directory):
+        item = name.partition('.')[0]
+        # Partial and temporary files belong to writes in progress
+        if not is_hash(item) or '.part' in name or '.tmp' in name: continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        paths, used, size = items.get(item, ([], 0, 0))
+        items[item] = (paths + [path], max(used, stat.st_mtime), size + stat.st_size)
+    total = sum(size for _, _, size in items.values())
+    now = time.time()
+    removed = 0
+    for item, (paths, used, size) in sorted(items.items(), key=lambda kv: kv[1][1]):
+        if item in keep:
+            for path in paths: touch(path)
+            continue
+        expired = STORE_TTL is not None and now - used > STORE_TTL
+        if not expired and (max_bytes is None or total <= max_bytes): continue
+        # A book's .idx goes first, so it is never seen without its text
+        for path in sorted(paths, key=lambda path: not path.endswith('.idx')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+def sweep_stores():
+    books = set(FILE_CACHE.memory.keys()) | set(FILE_CACHE.indexes.keys()) | set(FILE_CACHE.writers)
+    books |= {key[0] for key in LAYOUTS.keys()}
+    dictionaries = set(DICTIONARIES.compiled.keys()) | {DEFAULT_DICTIONARY.id}
+    for dictionary in DICTIONARIES.compiled.values():
+        # Patches are rebuilt from their base
+        if isinstance(dictionary, CompiledDictionary) and isinstance(dictionary.entries, PatchedEntries):
+            dictionaries.add(dictionary.entries.base_id)
+    removed = sweep_dir(FILE_CACHE.store_dir, BOOK_STORE_MAX_BYTES, books)
+    removed += sweep_dir(DICTIONARIES.store_dir, DICT_STORE_MAX_BYTES, dictionaries)
+    if PAGE_STORE is not None and PAGE_STORE_MAX_PAGES is not None:
+        try:
+            PAGE_STORE.trim('pages', PAGE_STORE_MAX_PAGES)
+        except sqlite3.Error as e:
+            print(f"Error trimming page store: {e}")
+    return removed
+
+@app.before_request
+def sweep_stores_when_due():
+    # Requests only check the clock; the sweep itself runs in the background
+    if STORE_SWEEP_INTERVAL is None: return
+    now = time.monotonic()
+    if STORE_SWEEP["checked"] and now - STORE_SWEEP["checked"] < STORE_SWEEP_INTERVAL: return
+    STORE_SWEEP["checked"] = now
+    STORE_SWEEP_POOL.submit(sweep_stores)
+
+# --- TERM INDEX ---
+# Where each dictionary term occurs in a book, built once per (book hash,
+# dictionary id) from the page tokens. Terms are keyed by their normalized,
+# accent-folded words, so "Élève" and "eleve" find the same occurrences.
+# Occurrences are packed as page << 32 | token position into sorted arrays.
+
+def term_key(text):
+    return " ".join(folded for exact, folded in map(normalize_word, text.split()) if exact)
+
+class TermIndex:
+    def __init__(self, pages_tokens):
+        self.occurrences = {}
+        self.known = array('I')  # known terms per page
+        self.tokens = array('I')  # tokens per page, line breaks excluded
+        for page_idx, tokens in enumerate(pages_tokens):
+            known = count = 0
+            for pos, t in enumerate(tokens):
+                if t.get("newline"): continue
+                count += 1
+                if not t["clickable"]: continue
+                known += 1
+                key = term_key(t["text"])
+                occurrences = self.occurrences.get(key)
+                if occurrences is None: occurrences = self.occurrences[key] = array('Q')
+                occurrences.append(page_idx << 32 | pos)
+            self.known.append(known)
+            self.tokens.append(count)
+
+    def find(self, term, page_idx=0, pos=-1):
+        # First occurrence after (page_idx, pos) as (page, position), or None
+        occurrences = self.occurrences.get(term_key(term))
+        if not occurrences: return None
+        i = bisect.bisect_left(occurrences, page_idx << 32 | max(pos + 1, 0))
+        if i == len(occurrences): return None
+        return occurrences[i] >> 32, occurrences[i] & 0xFFFFFFFF
+
+    def pages(self, term):
+        occurrences = self.occurrences.get(term_key(term), ())
+        pages = []
+        for occurrence in occurrences:
+            page_idx = occurrence >> 32
+            if not pages or pages[-1] != page_idx: pages.append(page_idx)
+        return pages, len(occurrences)
+
+    def approx_size(self):
+        size = 200 + self.known.itemsize * len(self.known) * 2
+        for key, occurrences in self.occurrences.items():
+            size += 150 + len(key) + occurrences.itemsize * len(occurrences)
+        return size
+
+TERM_INDEXES = LRUCache(TERM_INDEX_MAX_ENTRIES, TERM_INDEX_MAX_BYTES, lambda index: index.approx_size())
+TERM_INDEX_LOCK = threading.Lock()  # guards TERM_INDEX_BUILDS
+TERM_INDEX_BUILDS = {}  # (hash, dictionary id) -> lock held while that index is built
+
+def get_term_index(f_hash, pages, dictionary):
+    key = (f_hash, dictionary.id)
+    index = TERM_INDEXES.get(key)
+    if index is not None: return index
+    # Only requests for the same book and dictionary wait for each other
+    with TERM_INDEX_LOCK:
+        lock = TERM_INDEX_BUILDS.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            index = TERM_INDEXES.get(key)
+            if index is None:
+                # Cached pages are reused, the others tokenized without
+                # flooding PAGE_CACHE with the whole book
+                index = TermIndex(PAGE_CACHE.get((f_hash, idx, dictionary.id)) or tokenize_greedy(page, dictionary)
+                                  for idx, page in enumerate(pages))
+                TERM_INDEXES.put(key, index)
+    finally:
+        with TERM_INDEX_LOCK:
+            if TERM_INDEX_BUILDS.get(key) is lock: del TERM_INDEX_BUILDS[key]
+    return index
+
+# --- DICTIONARY PATCHES ---
+# A patch sets or removes single terms and registers the result as a new
+# dictionary version. Its matcher shares all untouched trie nodes with the
+# old one, and cached pages of the old version carry over unless the page
+# contains every (accent-folded) word of some changed key: only such pages
+# can tokenize differently. These are found through a word -> pages index
+# of the book, which does not depend on the dictionary.
+
+class WordIndex:
+    def __init__(self, pages):
+        self.pages = {}
+        for page_idx, page in enumerate(pages):
+            for word in {normalize_word(w)[1] for w in page.split()}:
+                pages_of = self.pages.get(word)
+                if pages_of is None: pages_of = self.pages[word] = array('I')
+                pages_of.append(page_idx)
+
+    def pages_with_all(self, words):
+        found = None
+        for word in words:
+            pages_of = self.pages.get(word)
+            if pages_of is None: return set()
+            found = set(pages_of) if found is None else found.intersection(pages_of)
+            if not found: break
+        return found or set()
+
+    def approx_size(self):
+        return 200 + sum(100 + len(w) + p.itemsize * len(p) for w, p in self.pages.items())
+
+WORD_INDEXES = LRUCache(WORD_INDEX_MAX_ENTRIES, WORD_INDEX_MAX_BYTES, lambda index: index.approx_size())
+
+def get_word_index(f_hash, pages):
+    index = WORD_INDEXES.get(f_hash)
+    if index is None:
+        index = WordIndex(pages)
+        WORD_INDEXES.put(f_hash, index)
+    return index
+
+def patch_dictionary(base, set_terms, remove_terms):
+    # Returns (new dictionary, changed normalized keys)
+    changes = {}
+    for key in remove_terms:
+        changes[normalize_key(key)] = _REMOVED
+    for key, translation in set_terms.items():
+        changes[normalize_key(key)] = translation
+    changes.pop('', None)
+    changed = {key for key, value in changes.items() if base.get(key, _REMOVED) != value}
+    if not changed: return base, changed
+    return DICTIONARIES.register_patch(base, {key: changes[key] for key in changed}), changed
+
+def carry_over_pages(old_id, new_id, changed):
+    # Copies cached pages (tokens and encoded responses) of old_id that the
+    # changed keys cannot affect to new_id. Returns (kept, invalidated).
+    by_book = {}
+    for key in PAGE_CACHE.keys():
+        if key[2] == old_id: by_book.setdefault(key[0], []).append(key)
+    changed_words = [[normalize_word(w)[1] for w in key.split()] for key in changed]
+    kept = invalidated = 0
+    for book, keys in by_book.items():
+        pages = book_pages(book)
+        if pages is None or FILE_CACHE.ingesting(book.partition('.')[0]): continue
+        index = get_word_index(book, pages)
+        affected = set()
+        for words in changed_words:
+            affected |= index.pages_with_all(words)
+        for key in keys:
+            if key[1] in affected:
+                invalidated += 1
+                continue
+            value = PAGE_CACHE.get(key)
+            if value is None: continue
+            PAGE_CACHE.put((key[0], key[1], new_id) + key[3:], value)
+            kept += 1
+    return kept, invalidated
+
+# The default book is loaded, hashed, paginated and pre-tokenized once and
+# reloaded only when the file's mtime changes. "html" is the rendered index
+# page for its initial_state.
+DEFAULT_BOOK = {"mtime": None, "pages": None, "initial_state": {"hash": None, "totalPages": 0}, "html": None}
+DEFAULT_BOOK_LOCK = threading.Lock()
+
+def load_default_book():
+    try:
+        mtime = os.path.getmtime(DEFAULT_TEXT_FILENAME)
+    except OSError:
+        mtime = None
+    with DEFAULT_BOOK_LOCK:
+        book = DEFAULT_BOOK
+        if mtime != book["mtime"]:
+            book["mtime"] = mtime
+            book["pages"] = None
+            book["initial_state"] = {"hash": None, "totalPages": 0}
+            book["html"] = None
+            if mtime is not None:
+                try:
+                    with open(DEFAULT_TEXT_FILENAME, 'r', encoding='utf-8') as f:
+                        text = f.read()
+                    # Process exactly like upload_text
+                    f_hash = calculate_hash(text)
+                    book["pages"] = split_into_pages(text)
+                    FILE_CACHE[f_hash] = book["pages"]
+                    FILE_CACHE.add_boundaries(f_hash, text.split('\n'))
+                    book["initial_state"] = {"hash": f_hash, "totalPages": len(book["pages"])}
+                except Exception as e:
+                    print(f"Error loading default file: {e}")
+        f_hash = book["initial_state"]["hash"]
+        # Keep the default book readable even if FILE_CACHE evicted it
+        if f_hash and f_hash not in FILE_CACHE:
+            FILE_CACHE[f_hash] = book["pages"]
+        return book
+
+def warm_default_book():
+    book = load_default_book()
+    f_hash = book["initial_state"]["hash"]
+    if not f_hash: return
+    dictionary = DEFAULT_DICTIONARY
+    for page_idx, page_text in enumerate(book["pages"]):
+        get_page_tokens(f_hash, page_idx, page_text, dictionary)
+
+# --- INSTRUMENTATION ---
+
+class Histogram:
+    # Cumulative Prometheus histogram, one series per label value
+    def __init__(self, name, help_text, buckets, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound: series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_value, series in sorted(self.series.items(), key=lambda item: str(item[0])):
+                labels = f'{self.label}="{label_value}",' if self.label else ''
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {series["count"]}')
+                suffix = f'{{{labels.rstrip(",")}}}' if labels else ''
+                lines.append(f'{self.name}_sum{suffix} {series["sum"]}')
+                lines.append(f'{self.name}_count{suffix} {series["count"]}')
+        return lines
+
+REQUEST_LATENCY = Histogram('reader_request_seconds', 'Request latency by route.', LATENCY_BUCKETS, 'route')
+TOKENS_PER_PAGE = Histogram('reader_tokens_per_page', 'Tokens in each served page.', TOKENS_BUCKETS)
+NULL_TIMER = nullcontext()
+
+class StageTimer:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        stages = g.setdefault('stages', {})
+        stages[self.stage] = stages.get(self.stage, 0.0) + time.perf_counter() - self.start
+
+def timed(stage):
+    # Adds the time spent in the block to the request's Server-Timing stage
+    return StageTimer(stage) if METRICS_ENABLED else NULL_TIMER
+
+def observe_tokens(tokens):
+    if METRICS_ENABLED: TOKENS_PER_PAGE.observe(len(tokens))
+
+@app.before_request
+def start_request_timer():
+    if METRICS_ENABLED: g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_timing(response):
+    if not METRICS_ENABLED or 'request_start' not in g: return response
+    total = time.perf_counter() - g.request_start
+    stages = g.get('stages', {})
+    response.headers['Server-Timing'] = ", ".join(
+        [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages.items()] +
+        [f"total;dur={total * 1000:.2f}"])
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_LATENCY.observe(total, route)
+    return response
+
+def cache_metrics(name, stats):
+    lines = []
+    for key in ("hits", "misses", "evictions"):
+        lines.append(f'reader_cache_{key}_total{{cache="{name}"}} {stats[key]}')
+    lines.append(f'reader_cache_hit_ratio{{cache="{name}"}} {stats["hit_ratio"]}')
+    lines.append(f'reader_cache_entries{{cache="{name}"}} {stats["entries"]}')
+    lines.append(f'reader_cache_bytes{{cache="{name}"}} {stats["bytes"]}')
+    return lines
+
 # --- ROUTES ---
 
+def invalid_page(f_hash):
+    # Pages past the end of a book still being ingested may not exist yet
+    if FILE_CACHE.ingesting(f_hash): return jsonify({"error": "Page not ready"}), 409
+    return jsonify({"error": "Invalid page"}), 400
+
+def request_page_size(value):
+    # Page size a reader asked for; None if it is not a number in range
+    if value in (None, ''): return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return None
+    return page_size if MIN_PAGE_SIZE <= page_size <= MAX_PAGE_SIZE else None
+
+def request_book(f_hash, page_size):
+    # (book id, pages, None) for a book at the requested page size, or
+    # (None, None, error response)
+    page_size = request_page_size(page_size)
+    if page_size is None: return None, None, (jsonify({"error": "Invalid page size"}), 400)
+    book = book_id(f_hash, page_size)
+    with timed('book'):
+        pages = book_pages(book) if is_hash(f_hash) else None
+    if pages is None:
+        if FILE_CACHE.ingesting(f_hash): return None, None, (jsonify({"error": "Book not ready"}), 409)
+        if f_hash in FILE_CACHE: return None, None, (jsonify({"error": "Page size not available for this book"}), 400)
+        return None, None, (jsonify({"error": "Session expired"}), 404)
+    return book, pages, None
+
+def request_dictionary(dict_id):
+    # Dictionary a reader asked for; None if the id is unknown or evicted
+    if not dict_id: return default_dictionary()
+    return DICTIONARIES.get(dict_id)
+
 @app.route('/')
 def index():
-    default_filename = 'lepetitprince.txt'
-    initial_state = {"hash": None, "totalPages": 0}
-    
-    # Check if default file exists
-    if os.path.exists(default_filename):
-        try:
-            with open(default_filename, 'r', encoding='utf-8') as f:
-                text = f.read()
-            
-            # Process exactly like upload_text
-            f_hash = calculate_hash(text)
-            pages = split_into_pages(text)
-            
-            # Store in the global cache immediately
-            FILE_CACHE[f_hash] = pages
-            
-            initial_state = {
-                "hash": f_hash, 
-                "totalPages": len(pages)
-            }
-        except Exception as e:
-            print(f"Error loading default file: {e}")
+    book = load_default_book()
+    if book["html"] is None:
+        # Pass the initial_state to the template
+        book["html"] = render_template_string(HTML_TEMPLATE, initial_state=book["initial_state"],
+                                              max_pages_per_request=MAX_PAGES_PER_REQUEST,
+                                              default_page_size=DEFAULT_PAGE_SIZE, page_sizes=PAGE_SIZE_CHOICES)
+    return book["html"]
 
-    # Pass the initial_state to the template
-    return render_template_string(HTML_TEMPLATE, initial_state=initial_state)
 @app.route('/upload_text', methods=['POST'])
 def upload_text():
+    # Returns the hash and an ingestion job; pages become readable as the
+    # job produces them
     if 'file' not in request.files: return jsonify({"error": "No file"}), 400
     file = request.files['file']
-    text = file.read().decode('utf-8')
-    f_hash = calculate_hash(text)
-    pages = split_into_pages(text)
-    FILE_CACHE[f_hash] = pages
-    return jsonify({"hash": f_hash, "total_pages": len(pages)})
+    dictionary = request_dictionary(request.form.get('dictionary'))
+    job = start_ingest(file.stream, dictionary)
+    if job is None: return jsonify({"error": "Upload is busy, please try again"}), 503
+    return jsonify(job)
+
+@app.route('/upload_status')
+def upload_status():
+    job = INGEST_JOBS.get(request.args.get('job') or '')
+    if job is None: job = book_status(request.args.get('hash'))
+    if job is None: return jsonify({"error": "No such upload"}), 404
+    return jsonify(job)
 
 @app.route('/upload_dict', methods=['POST'])
 def upload_dict():
-    global CURRENT_DICTIONARY
     if 'file' not in request.files: return jsonify({"error": "No file"}), 400
-    try:
-        data = json.load(request.files['file'])
-        CURRENT_DICTIONARY = normalize_dict(data)
-        return jsonify({"success": True, "count": len(CURRENT_DICTIONARY)})
-    except:
-        return jsonify({"error": "Invalid JSON"}), 400
+    file = request.files['file']
+    # Entries of a JSON, NDJSON or TSV upload that were skipped
+    malformed = {"malformed": 0, "malformed_entries": []}
+    if file.stream.read(len(RLDICT_MAGIC)) == RLDICT_MAGIC:
+        file.stream.seek(0)
+        try:
+            dictionary = DICTIONARIES.ingest_compiled(file.stream)
+        except (OSError, ValueError):
+            return jsonify({"error": "Invalid compiled dictionary"}), 400
+    else:
+        file.stream.seek(0)
+        try:
+            loaded = load_dictionary(file.stream, dictionary_format(file.filename))
+        except ValueError:
+            return jsonify({"error": "Invalid dictionary"}), 400
+        dictionary = DICTIONARIES.register(loaded.entries, loaded.matcher)
+        malformed = {"malformed": loaded.malformed, "malformed_entries": loaded.malformed_entries}
+    # Only the uploading reader's book is affected by the new dictionary
+    f_hash = request.form.get('hash')
+    pages = FILE_CACHE.get(f_hash)
+    if pages is not None and not FILE_CACHE.ingesting(f_hash): start_pretokenize(f_hash, pages, dictionary)
+    return jsonify({"success": True, "count": len(dictionary), "dictionary_id": dictionary.id, **malformed})
+
+@app.route('/patch_dict', methods=['POST'])
+def patch_dict():
+    # {"dictionary": id or null for the default, "set": {term: translation},
+    #  "remove": [term, ...]} -> id of the patched dictionary
+    data = request.json or {}
+    base = request_dictionary(data.get('dictionary'))
+    if base is None: return jsonify({"error": "Dictionary expired"}), 404
+    set_terms = data.get('set') or {}
+    remove_terms = data.get('remove') or []
+    if not isinstance(set_terms, dict) or not isinstance(remove_terms, list):
+        return jsonify({"error": "Invalid patch"}), 400
+    dictionary, changed = patch_dictionary(base, set_terms, remove_terms)
+    kept, invalidated = carry_over_pages(base.id, dictionary.id, changed) if changed else (0, 0)
+    return jsonify({"success": True, "count": len(dictionary), "dictionary_id": dictionary.id,
+                    "changed": len(changed), "pages_kept": kept, "pages_invalidated": invalidated})
 
 @app.route('/get_page', methods=['POST'])
 def get_page():
     data = request.json
     f_hash = data.get('hash')
     page_idx = int(data.get('page', 0))
-    if f_hash not in FILE_CACHE: return jsonify({"error": "Session expired"}), 404
-    pages = FILE_CACHE[f_hash]
-    if page_idx < 0 or page_idx >= len(pages): return jsonify({"error": "Invalid page"}), 400
-    return jsonify({"page_idx": page_idx, "tokens": tokenize_greedy(pages[page_idx])})
+    book, pages, error = request_book(f_hash, data.get('page_size'))
+    if error: return error
+    with timed('dictionary'):
+        dictionary = request_dictionary(data.get('dictionary'))
+    if dictionary is None: return jsonify({"error": "Dictionary expired"}), 404
+    if page_idx < 0: return jsonify({"error": "Invalid page"}), 400
+    if page_idx >= len(pages): return invalid_page(f_hash)
+    with timed('tokenize'):
+        tokens = get_page_tokens(book, page_idx, pages[page_idx], dictionary)
+    observe_tokens(tokens)
+    with timed('serialize'):
+        return jsonify({"page_idx": page_idx, "tokens": format_tokens(tokens, data.get('format'))})
+
+@app.route('/get_pages', methods=['POST'])
+def get_pages():
+    # Tokens for pages [page, page + count), clipped to the end of the book
+    data = request.json
+    f_hash = data.get('hash')
+    start = int(data.get('page', 0))
+    count = min(int(data.get('count', 1)), MAX_PAGES_PER_REQUEST)
+    book, pages, error = request_book(f_hash, data.get('page_size'))
+    if error: return error
+    with timed('dictionary'):
+        dictionary = request_dictionary(data.get('dictionary'))
+    if dictionary is None: return jsonify({"error": "Dictionary expired"}), 404
+    if start < 0 or count < 1: return jsonify({"error": "Invalid page"}), 400
+    if start >= len(pages): return invalid_page(f_hash)
+    end = min(start + count, len(pages))
+    results = []
+    for idx in range(start, end):
+        with timed('tokenize'):
+            tokens = get_page_tokens(book, idx, pages[idx], dictionary)
+        observe_tokens(tokens)
+        results.append({"page_idx": idx, "tokens": tokens})
+    with timed('serialize'):
+        for result in results:
+            result["tokens"] = format_tokens(result["tokens"], data.get('format'))
+        return jsonify({"pages": results})
+
+@app.route('/page/<f_hash>/<int:page_idx>')
+def get_page_cached(f_hash, page_idx):
+    # Cacheable GET variant of /get_page, with ?dictionary=, ?format= and
+    # ?page_size=. Pages of the default dictionary are revalidated, since its
+    # id changes when dictionary.json does; pages of an uploaded dictionary
+    # never change.
+    dict_id = request.args.get('dictionary') or None
+    version = request.args.get('format', type=int)
+    page_size = request_page_size(request.args.get('page_size'))
+    if page_size is None: return jsonify({"error": "Invalid page size"}), 400
+    book = book_id(f_hash, page_size)
+    # One snapshot of the default dictionary for the tag, key and tokens
+    default = None if dict_id else default_dictionary()
+    etag = page_etag(book, page_idx, dict_id or default.id, version)
+    response = not_modified(etag, dict_id)
+    if response is not None: return response
+
+    key = (book, page_idx, dict_id or default.id, version)
+    encoded = PAGE_CACHE.get(key)
+    if encoded is None:
+        book, pages, error = request_book(f_hash, page_size)
+        if error: return error
+        with timed('dictionary'):
+            dictionary = default if default is not None else request_dictionary(dict_id)
+        if dictionary is None: return jsonify({"error": "Dictionary expired"}), 404
+        if page_idx >= len(pages): return invalid_page(f_hash)
+        with timed('tokenize'):
+            tokens = get_page_tokens(book, page_idx, pages[page_idx], dictionary)
+        observe_tokens(tokens)
+        with timed('serialize'):
+            encoded = encode_page(page_idx, tokens, version)
+        PAGE_CACHE.put(key, encoded)
+    return encoded_response(encoded, etag, dict_id)
+
+@app.route('/pages/<f_hash>/<int:start>/<int:end>')
+def get_pages_cached(f_hash, start, end):
+    # Cacheable GET variant of /get_pages for pages [start, end), clipped to
+    # MAX_PAGES_PER_REQUEST and the end of the book, with the query of
+    # /page/. Pages are taken from, and added to, the per-page cache of
+    # /page/; the batch is compressed as a whole.
+    dict_id = request.args.get('dictionary') or None
+    version = request.args.get('format', type=int)
+    page_size = request_page_size(request.args.get('page_size'))
+    if page_size is None: return jsonify({"error": "Invalid page size"}), 400
+    if start >= end: return jsonify({"error": "Invalid page"}), 400
+    end = min(end, start + MAX_PAGES_PER_REQUEST)
+    book = book_id(f_hash, page_size)
+    default = None if dict_id else default_dictionary()
+    etag = page_etag(book, f"{start}-{end}", dict_id or default.id, version)
+    response = not_modified(etag, dict_id)
+    if response is not None: return response
+
+    keys = [(book, idx, dict_id or default.id, version) for idx in range(start, end)]
+    encoded = [PAGE_CACHE.get(key) for key in keys]
+    if None in encoded:
+        book, pages, error = request_book(f_hash, page_size)
+        if error: return error
+        with timed('dictionary'):
+            dictionary = default if default is not None else request_dictionary(dict_id)
+        if dictionary is None: return jsonify({"error": "Dictionary expired"}), 404
+        if start >= len(pages): return invalid_page(f_hash)
+        keys = keys[:len(pages) - start]
+        encoded = encoded[:len(keys)]
+        for i, key in enumerate(keys):
+            if encoded[i] is not None: continue
+            idx = start + i
+            with timed('tokenize'):
+                tokens = get_page_tokens(book, idx, pages[idx], dictionary)
+            observe_tokens(tokens)
+            with timed('serialize'):
+                encoded[i] = encode_page(idx, tokens, version)
+            PAGE_CACHE.put(key, encoded[i])
+    with timed('serialize'):
+        body = encode_body(b'{"pages":[' + b','.join(page["identity"] for page in encoded) + b']}')
+    return encoded_response(body, etag, dict_id)
+
+def page_cache_control(dict_id):
+    # Pages of an uploaded dictionary never change; those of the default
+    # dictionary are revalidated
+    return f"public, max-age={PAGE_MAX_AGE}, immutable" if dict_id else "no-cache"
+
+def not_modified(etag, dict_id):
+    # 304 response if the request holds etag in any encoding, else None
+    for tag in [etag] + [f"{etag}-{encoding}" for encoding in PAGE_ENCODINGS]:
+        if request.if_none_match.contains(tag):
+            response = Response(status=304)
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = page_cache_control(dict_id)
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+    return None
+
+def encoded_response(encoded, etag, dict_id):
+    # Serves the best encoding of encoded the client accepts
+    encoding = request.accept_encodings.best_match([e for e in PAGE_ENCODINGS if e in encoded]) or 'identity'
+    response = Response(encoded[encoding], mimetype='application/json')
+    if encoding != 'identity': response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag if encoding == 'identity' else f"{etag}-{encoding}")
+    response.headers['Cache-Control'] = page_cache_control(dict_id)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def request_term_index(args):
+    # (TermIndex, None) for the book and dictionary of a request, or (None, error response)
+    f_hash = args.get('hash')
+    book, pages, error = request_book(f_hash, args.get('page_size'))
+    if error: return None, error
+    if FILE_CACHE.ingesting(f_hash): return None, (jsonify({"error": "Book not ready"}), 409)
+    dictionary = request_dictionary(args.get('dictionary'))
+    if dictionary is None: return None, (jsonify({"error": "Dictionary expired"}), 404)
+    with timed('index'):
+        return get_term_index(book, pages, dictionary), None
+
+@app.route('/layout')
+def layout():
+    # Page count at ?page_size=, and the page there that holds the start of
+    # page ?page= at ?from_size=, so a reader keeps their place
+    f_hash = request.args.get('hash')
+    page_size = request_page_size(request.args.get('page_size'))
+    from_size = request_page_size(request.args.get('from_size'))
+    if page_size is None or from_size is None: return jsonify({"error": "Invalid page size"}), 400
+    if not is_hash(f_hash) or f_hash not in FILE_CACHE: return jsonify({"error": "Session expired"}), 404
+    if FILE_CACHE.ingesting(f_hash): return jsonify({"error": "Book not ready"}), 409
+    target, source = get_layout(f_hash, page_size), get_layout(f_hash, from_size)
+    if target is None or source is None: return jsonify({"error": "Page size not available for this book"}), 400
+    page_idx = min(max(request.args.get('page', 0, type=int), 0), len(source) - 1)
+    page = target.page_at(source.offsets[page_idx]) if page_idx >= 0 else 0
+    return jsonify({"page_size": page_size, "total_pages": len(target), "page": page})
+
+@app.route('/find_term')
+def find_term():
+    # Next occurrence of ?term= after token ?pos= of ?page= (from the start
+    # of that page without pos)
+    index, error = request_term_index(request.args)
+    if error: return error
+    page_idx = request.args.get('page', 0, type=int)
+    pos = request.args.get('pos', -1, type=int)
+    found = index.find(request.args.get('term', ''), page_idx, pos)
+    if found is None: return jsonify({"page": None, "position": None})
+    return jsonify({"page": found[0], "position": found[1]})
+
+@app.route('/term_pages')
+def term_pages():
+    index, error = request_term_index(request.args)
+    if error: return error
+    pages, occurrences = index.pages(request.args.get('term', ''))
+    return jsonify({"pages": pages, "occurrences": occurrences})
+
+@app.route('/known_terms')
+def known_terms():
+    # Known-term and token counts per page, e.g. to pick pages by density
+    index, error = request_term_index(request.args)
+    if error: return error
+    return jsonify({"known": index.known.tolist(), "tokens": index.tokens.tolist()})
+
+@app.route('/pretokenize_status')
+def pretokenize_status():
+    f_hash = request.args.get('hash')
+    dict_id = request.args.get('dictionary') or default_dictionary().id
+    job = PRETOKENIZE_JOBS.get((f_hash, dict_id))
+    if job is None: return jsonify({"error": "No pre-tokenization job"}), 404
+    return jsonify(job)
+
+@app.route('/metrics')
+def metrics():
+    lines = []
+    lines += REQUEST_LATENCY.render()
+    lines += TOKENS_PER_PAGE.render()
+    lines.append("# TYPE reader_dictionary_terms gauge")
+    lines.append(f"reader_dictionary_terms{{dictionary=\"default\"}} {len(DEFAULT_DICTIONARY)}")
+    lines.append("# TYPE reader_dictionaries_loaded gauge")
+    lines.append(f"reader_dictionaries_loaded {len(DICTIONARIES.compiled)}")
+    lines += cache_metrics("pages", PAGE_CACHE.stats())
+    lines += cache_metrics("books", FILE_CACHE.stats())
+    lines += cache_metrics("dictionaries", DICTIONARIES.stats())
+    normalize = normalize_word.cache_info()
+    lines.append(f'reader_cache_hits_total{{cache="normalize"}} {normalize.hits}')
+    lines.append(f'reader_cache_misses_total{{cache="normalize"}} {normalize.misses}')
+    lines.append(f'reader_cache_entries{{cache="normalize"}} {normalize.currsize}')
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify({
+        "pages": PAGE_CACHE.stats(),
+        "books": FILE_CACHE.stats(),
+        "dictionaries": DICTIONARIES.stats(),
+        "term_indexes": TERM_INDEXES.stats(),
+        "normalize": normalize_word.cache_info()._asdict()
+    })
 
 # --- TEMPLATE ---
 
@@ -425,7 +3024,7 @@ HTML_TEMPLATE = """
 
             <div class="controls-group">
                 <h4>2. Dictionary</h4>
-                <input type="file" id="dict-input" accept=".json">
+                <input type="file" id="dict-input" accept=".json,.ndjson,.jsonl,.tsv,.rldict">
                 <button class="btn" onclick="uploadDict()">Load</button>
                 <div id="dict-status" style="font-size: 12px; margin-top: 5px; color: #64748b;">Default Loaded</div>
             </div>
@@ -438,7 +3037,11 @@ HTML_TEMPLATE = """
                 of <span id="total-pages">0</span>
             </span>
             <button class="btn" onclick="changePage(1)">Next →</button>
+            <select id="page-size" onchange="changePageSize()" style="padding: 4px; border: 1px solid #ccc; border-radius: 4px; color: #64748b;">
+                {% for size in page_sizes %}<option value="{{ size }}">{{ size }} characters</option>{% endfor %}
+            </select>
         </div>
+        <div id="timing" style="display: none; text-align: center; font-size: 12px; color: #94a3b8; margin-bottom: 10px;"></div>
         
         <div id="text-display">
             <div style="text-align: center; color: #94a3b8; margin-top: 50px;">
@@ -480,41 +3083,141 @@ HTML_TEMPLATE = """
         let totalPages = startData.totalPages;
         let currentPage = 0;
         let selectedWords = []; 
+        // Page size in characters chosen by the reader, and the size the
+        // open book is laid out at: the default one while it is ingested.
+        // Positions are saved as "<page>:<size>" and mapped between sizes
+        // through /layout.
+        const DEFAULT_PAGE_SIZE = {{ default_page_size }};
+        let pageSize = parseInt(localStorage.getItem('reader_page_size')) || DEFAULT_PAGE_SIZE;
+        let layoutSize = DEFAULT_PAGE_SIZE;
+        // Id of this reader's uploaded dictionary; null means the default one
+        let dictionaryId = localStorage.getItem('reader_dict');
+
+        // Client-side page cache: tokens of pages around the current one are
+        // fetched ahead from /pages/<hash>/<start>/<end> so that page turns
+        // render without waiting for the server.
+        const MAX_PAGES_PER_REQUEST = {{ max_pages_per_request }};
+        const PREFETCH_BEHIND = 1;
+        const PREFETCH_AHEAD = 3;
+        const PAGE_CACHE_RADIUS = 10;
+        const pageCache = new Map();
+        const pagesInFlight = new Set();
+        let pageCacheEpoch = 0;
+
+        // Open the reader with ?timing=1 to show how long the current page
+        // took to fetch (and, with METRICS_ENABLED, on the server) and to render
+        const SHOW_TIMING = new URLSearchParams(location.search).has('timing');
+        const pageTimings = new Map();
 
         load_default_dictionary();
 
         function init() {
+            document.getElementById('page-size').value = pageSize;
             if (currentHash) {
-                document.getElementById('total-pages').innerText = totalPages;
                 document.getElementById('nav-area').style.display = 'flex';
                 
                 // Remove the "Please upload" message
                 document.getElementById('text-display').innerText = '';
                 
-                // Check if we have a saved position for this specific file, otherwise 0
-                const savedPage = localStorage.getItem(`reader_pos_${currentHash}`);
-                currentPage = savedPage ? parseInt(savedPage) : 0;
-                
-                loadPage(currentPage);
+                openBook(totalPages);
             }
         }
 
+        // Saved [page, size] for the current book, [0, default] if there is
+        // none; positions saved without a size are in the default size
+        function savedPosition() {
+            const saved = (localStorage.getItem(`reader_pos_${currentHash}`) || '0').split(':');
+            return [parseInt(saved[0]) || 0, parseInt(saved[1]) || DEFAULT_PAGE_SIZE];
+        }
+
+        // Opens the current book at the reader's page size and saved position.
+        // defaultTotal is its page count at the default size.
+        async function openBook(defaultTotal) {
+            const [page, size] = savedPosition();
+            if (pageSize !== DEFAULT_PAGE_SIZE || size !== DEFAULT_PAGE_SIZE) {
+                const error = await applyLayout(pageSize, size, page);
+                if (!error) return;
+            }
+            // Books stored before page sizes could be chosen only have the default one
+            layoutSize = DEFAULT_PAGE_SIZE;
+            totalPages = defaultTotal;
+            document.getElementById('total-pages').innerText = totalPages;
+            loadPage(size === DEFAULT_PAGE_SIZE ? Math.min(page, totalPages - 1) : 0);
+        }
+
+        // Lays the current book out at size, staying on the page that holds
+        // the start of page idx at fromSize. Returns the error, if any.
+        async function applyLayout(size, fromSize, idx) {
+            const hash = currentHash;
+            const res = await fetch(`/layout?hash=${hash}&page_size=${size}&from_size=${fromSize}&page=${idx}`);
+            const data = await res.json();
+            if (data.error || hash !== currentHash) return data.error || null;
+            layoutSize = size;
+            totalPages = data.total_pages;
+            resetPageCache();
+            document.getElementById('total-pages').innerText = totalPages;
+            loadPage(data.page);
+            return null;
+        }
+
+        function changePageSize() {
+            pageSize = parseInt(document.getElementById('page-size').value);
+            localStorage.setItem('reader_page_size', pageSize);
+            if (!currentHash || pageSize === layoutSize) return;
+            // A book still being ingested is laid out again once it is complete
+            applyLayout(pageSize, layoutSize, currentPage).then(error => {
+                if (error && error !== "Book not ready") alert(error);
+            });
+        }
+
         async function uploadText() {
             const fileInput = document.getElementById('text-input');
             if (fileInput.files.length === 0) return alert("Select a text file");
             const formData = new FormData();
             formData.append('file', fileInput.files[0]);
+            if (dictionaryId) formData.append('dictionary', dictionaryId);
             const res = await fetch('/upload_text', { method: 'POST', body: formData });
             const data = await res.json();
+            if(data.error) return alert(data.error);
             currentHash = data.hash;
-            totalPages = data.total_pages;
+            layoutSize = DEFAULT_PAGE_SIZE;
+            totalPages = data.ready_pages;
+            resetPageCache();
             
-            document.getElementById('total-pages').innerText = totalPages;
             document.getElementById('nav-area').style.display = 'flex';
             
-            const savedPage = localStorage.getItem(`reader_pos_${currentHash}`);
-            currentPage = savedPage ? parseInt(savedPage) : 0;
-            loadPage(currentPage);
+            // A position saved at another size can only be mapped once the book is complete
+            const [page, size] = savedPosition();
+            showIngestStatus(data, size === DEFAULT_PAGE_SIZE ? page : null);
+        }
+
+        // Follows the ingestion of an uploaded book, opening it at page idx
+        // of the default layout as soon as that page exists rather than when
+        // the whole book is in, and at the reader's page size once it is.
+        const INGEST_POLL_MS = 500;
+        async function showIngestStatus(data, idx) {
+            const hash = data.hash;
+            let opened = false;
+            while (hash === currentHash) {
+                if (data.error) return alert(data.error);
+                if (data.state === 'done') {
+                    if (!opened) return openBook(data.total_pages);
+                    totalPages = data.total_pages;
+                    document.getElementById('total-pages').innerText = totalPages;
+                    if (pageSize !== layoutSize) applyLayout(pageSize, layoutSize, currentPage);
+                    return;
+                }
+                totalPages = data.ready_pages;
+                document.getElementById('total-pages').innerText = totalPages + '+';
+                if (!opened && idx !== null && totalPages > idx) {
+                    opened = true;
+                    loadPage(idx);
+                }
+                if (data.state !== 'running') return;
+                await new Promise(resolve => setTimeout(resolve, INGEST_POLL_MS));
+                const query = `hash=${hash}` + (data.job ? `&job=${data.job}` : '');
+                data = await (await fetch(`/upload_status?${query}`)).json();
+            }
         }
 
         init();
@@ -524,58 +3227,194 @@ HTML_TEMPLATE = """
             if (fileInput.files.length === 0) return alert("Select a JSON dictionary");
             const formData = new FormData();
             formData.append('file', fileInput.files[0]);
+            if (currentHash) formData.append('hash', currentHash);
             try {
                 const res = await fetch('/upload_dict', { method: 'POST', body: formData });
                 const data = await res.json();
                 if(data.error) throw new Error(data.error);
-                document.getElementById('dict-status').innerText = `Custom (${data.count} terms)`;
+                dictionaryId = data.dictionary_id;
+                localStorage.setItem('reader_dict', dictionaryId);
+                const skipped = data.malformed ? `, ${data.malformed} skipped` : '';
+                document.getElementById('dict-status').innerText = `Custom (${data.count} terms${skipped})`;
                 document.getElementById('dict-status').style.color = "var(--success)";
+                resetPageCache();
                 if (currentHash) loadPage(currentPage);
             } catch(e) { alert("Error uploading dictionary"); }
         }
 
+        async function fetchPages(start, end) {
+            start = Math.max(0, start);
+            end = Math.min(totalPages, end);
+            // Pages already cached are not fetched again
+            const indices = [];
+            for (let i = start; i < end; i++) if (!pageCache.has(i)) indices.push(i);
+            if (!indices.length) return;
+            const epoch = pageCacheEpoch;
+            indices.forEach(i => pagesInFlight.add(i));
+            try {
+                // One cacheable GET per run of consecutive pages, at most
+                // MAX_PAGES_PER_REQUEST pages long
+                const runs = [];
+                indices.forEach(i => {
+                    const run = runs[runs.length - 1];
+                    if (run && run.end === i && i - run.start < MAX_PAGES_PER_REQUEST) run.end = i + 1;
+                    else runs.push({ start: i, end: i + 1 });
+                });
+                const query = `?format=2&page_size=${layoutSize}` + (dictionaryId ? `&dictionary=${encodeURIComponent(dictionaryId)}` : '');
+                const requests = runs.map(run => {
+                    const started = performance.now();
+                    return fetch(`/pages/${currentHash}/${run.start}/${run.end}${query}`).then(async res => {
+                        const data = await res.json();
+                        if (data.error) return [data];
+                        if (SHOW_TIMING) data.pages.forEach(p => pageTimings.set(p.page_idx, { fetch: performance.now() - started, server: serverTime(res) }));
+                        return data.pages;
+                    }).catch(e => [{ error: e.message }]);
+                });
+                const pages = (await Promise.all(requests)).flat();
+                // Ignore responses for a book or dictionary that was replaced meanwhile
+                if (epoch !== pageCacheEpoch) return;
+                // Pages that loaded are kept even if others failed
+                pages.forEach(p => { if (!p.error) pageCache.set(p.page_idx, p.tokens); });
+                const failed = pages.find(p => p.error);
+                if (failed && failed.error === "Dictionary expired") {
+                    useDefaultDictionary();
+                    const err = new Error("Your dictionary is no longer available, please upload it again. Showing the default dictionary.");
+                    err.retry = true;
+                    throw err;
+                }
+                if (failed) throw new Error(failed.error);
+            } finally {
+                if (epoch === pageCacheEpoch) indices.forEach(i => pagesInFlight.delete(i));
+            }
+        }
+
+        function prefetchAround(idx) {
+            let start = null, end = null;
+            for (let i = idx - PREFETCH_BEHIND; i <= idx + PREFETCH_AHEAD; i++) {
+                if (i < 0 || i >= totalPages || pageCache.has(i) || pagesInFlight.has(i)) continue;
+                if (start === null) start = i;
+                end = i + 1;
+            }
+            if (start !== null) fetchPages(start, end).catch(() => {});
+            for (const key of pageCache.keys()) {
+                if (Math.abs(key - idx) > PAGE_CACHE_RADIUS) {
+                    pageCache.delete(key);
+                    pageTimings.delete(key);
+                }
+            }
+        }
+
+        function resetPageCache() {
+            pageCacheEpoch++;
+            pageCache.clear();
+            pagesInFlight.clear();
+            pageTimings.clear();
+        }
+
         async function loadPage(idx) {
             if (idx < 0 || idx >= totalPages) return;
             currentPage = idx;
             document.getElementById('page-num').value = currentPage + 1;
-            if(currentHash) localStorage.setItem(`reader_pos_${currentHash}`, currentPage);
+            if(currentHash) localStorage.setItem(`reader_pos_${currentHash}`, `${currentPage}:${layoutSize}`);
             
-            const res = await fetch('/get_page', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({ hash: currentHash, page: currentPage })
-            });
-            const data = await res.json();
-            if(data.error) return alert(data.error);
-            renderTokens(data.tokens);
+            // The page is fetched and shown on its own; its neighbours are
+            // prefetched afterwards, and their errors are ignored
+            if (!pageCache.has(idx)) {
+                try {
+                    await fetchPages(idx, idx + 1);
+                } catch(e) {
+                    alert(e.message);
+                    // Retry once the dictionary fell back to the default
+                    if (e.retry && idx === currentPage) loadPage(idx);
+                    return;
+                }
+                // The reader may have moved on while this page was loading
+                if (idx !== currentPage || !pageCache.has(idx)) return;
+            }
+            renderTokens(pageCache.get(idx));
+            prefetchAround(idx);
         }
 
         function changePage(delta) { loadPage(currentPage + delta); }
         function jumpToPage() { loadPage(parseInt(document.getElementById('page-num').value) - 1); }
 
+        // Calls fn(text, clickable, translation, newline) for every token of
+        // a page in either wire format: a list of token objects (version 1)
+        // or parallel text/ref arrays with a translation table (version 2).
+        function forEachToken(tokens, fn) {
+            if (tokens.v === 2) {
+                for (let i = 0; i < tokens.text.length; i++) {
+                    const ref = tokens.ref[i];
+                    fn(tokens.text[i], ref >= 0, ref >= 0 ? tokens.translations[ref] : null, ref === -2);
+                }
+                return;
+            }
+            tokens.forEach(t => fn(t.text, t.clickable, t.translation, !!t.newline));
+        }
+
+        // Token spans, each followed by its own space, and <br>s are kept
+        // from page to page and only updated; a page is assembled in a
+        // fragment and attached in one go. Clicks are handled once on the
+        // container, which finds the token by the span's data-i.
+        const spanPool = [];
+        const brPool = [];
+        let pageTranslations = [];
+
         function renderTokens(tokens) {
+            const started = performance.now();
             const container = document.getElementById('text-display');
-            container.innerHTML = '';
-            tokens.forEach(token => {
-                // Handle newlines
-                if (token.newline) {
-                    container.appendChild(document.createElement('br'));
+            const fragment = document.createDocumentFragment();
+            let spans = 0, brs = 0;
+            pageTranslations = [];
+            forEachToken(tokens, (text, clickable, translation, newline) => {
+                if (newline) {
+                    if (brs === brPool.length) brPool.push(document.createElement('br'));
+                    fragment.appendChild(brPool[brs++]);
                     return;
                 }
-
-                const span = document.createElement('span');
-                span.innerText = token.text;
-                span.classList.add('token');
-                
-                if (token.clickable) {
-                    span.classList.add('clickable');
-                    span.onclick = () => addWordToList(token.text, token.translation);
+                if (spans === spanPool.length) {
+                    const span = document.createElement('span');
+                    span.dataset.i = spans;
+                    spanPool.push([span, document.createTextNode(' ')]);
                 }
-                
-                container.appendChild(span);
-                // Add a space after words, unless it's the end of a line
-                container.appendChild(document.createTextNode(' ')); 
+                const [span, space] = spanPool[spans];
+                span.textContent = text;
+                span.className = clickable ? 'token clickable' : 'token';
+                pageTranslations[spans++] = clickable ? translation : undefined;
+                fragment.appendChild(span);
+                fragment.appendChild(space);
             });
+            container.textContent = '';
+            container.appendChild(fragment);
+            if (SHOW_TIMING) {
+                // Reading offsetHeight forces layout, so it is included in the time
+                container.offsetHeight;
+                showTiming(spans, performance.now() - started);
+            }
+        }
+
+        document.getElementById('text-display').addEventListener('click', e => {
+            const span = e.target.closest('.token.clickable');
+            if (span) addWordToList(span.textContent, pageTranslations[span.dataset.i]);
+        });
+
+        // Total request time from the Server-Timing header, if there is one
+        function serverTime(res) {
+            const header = res.headers.get('Server-Timing');
+            const total = header && header.match(/total;dur=([0-9.]+)/);
+            return total ? parseFloat(total[1]) : null;
+        }
+
+        function showTiming(tokenCount, renderMs) {
+            const timing = pageTimings.get(currentPage);
+            const parts = [`${tokenCount} tokens`, `render ${renderMs.toFixed(1)} ms`];
+            if (timing) {
+                parts.push(`fetch ${timing.fetch.toFixed(1)} ms`);
+                if (timing.server !== null) parts.push(`server ${timing.server.toFixed(1)} ms`);
+            }
+            const el = document.getElementById('timing');
+            el.innerText = parts.join(' · ');
+            el.style.display = 'block';
         }
 
         function addWordToList(text, translation) {
@@ -636,14 +3475,45 @@ HTML_TEMPLATE = """
         }
 
         function load_default_dictionary() {
-            // Placeholder logic for UI init
+            if (!dictionaryId) return;
+            document.getElementById('dict-status').innerText = 'Custom';
+            document.getElementById('dict-status').style.color = "var(--success)";
+        }
+
+        function useDefaultDictionary() {
+            dictionaryId = null;
+            localStorage.removeItem('reader_dict');
+            document.getElementById('dict-status').innerText = 'Default Loaded';
+            document.getElementById('dict-status').style.color = '';
+            resetPageCache();
         }
     </script>
 </body>
 </html>
 """
 
-load_default_dictionary()
+# --- STARTUP ---
+# Loading the default dictionary and warming the default book write to the
+# stores, so they run when the app starts serving rather than on import
+# (compile_dict.py, bench.py, the tests and pre-tokenization workers all
+# import this module).
+
+STARTUP = {"done": False}
+STARTUP_LOCK = threading.Lock()
+
+def start_up():
+    with STARTUP_LOCK:
+        if STARTUP["done"]: return
+        DICTIONARY_RELOAD["mtimes"] = default_dictionary_mtimes()
+        load_default_dictionary()
+        warm_default_book()
+        STARTUP["done"] = True
+
+@app.before_request
+def start_up_on_first_request():
+    # Concurrent first requests wait for the default dictionary
+    if not STARTUP["done"]: start_up()
 
 if __name__ == '__main__':
+    start_up()
     app.run(debug=True, port=5000)
\ No newline at end of file
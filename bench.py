@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import app
+from synthetic import make_dictionary, make_text, make_vocabulary, parse_sizes
+
+# Offline microbenchmarks for the hot paths of app.py on synthetic corpora:
+#
+#   python bench.py                              # 10K..1M texts, 100..100K dictionaries
+#   python bench.py --full                       # up to 100M texts and 1M dictionaries
+#   python bench.py --output new.json --compare old.json
+#
+# Texts and dictionaries are generated from a seeded RNG, so runs on
+# different commits measure identical inputs.
+
+DEFAULT_TEXT_SIZES = '10K,100K,1M'
+DEFAULT_DICT_SIZES = '100,10K,100K'
+FULL_TEXT_SIZES = '10K,100K,1M,10M,100M'
+FULL_DICT_SIZES = '100,10K,100K,1M'
+
+def measure(fn, repeat, memory):
+    times = []
+    result = None
+    for _ in range(repeat):
+        app.normalize_word.cache_clear()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        app.normalize_word.cache_clear()
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, times, peak
+
+def record(results, name, params, times, peak, work, unit):
+    best = min(times)
+    row = dict(params)
+    row.update({
+        "bench": name,
+        "best_s": best,
+        "median_s": statistics.median(times),
+        "throughput": work / best if best else None,
+        "unit": unit,
+        "peak_bytes": peak,
+    })
+    results.append(row)
+    peak_str = f"{peak / 1e6:8.1f} MB" if peak is not None else "       -"
+    label = " ".join(f"{k}={v}" for k, v in params.items())
+    print(f"{name:18} {label:32} {best * 1000:10.2f} ms {row['throughput']:14,.0f} {unit:8} {peak_str}")
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def result_key(row):
+    return (row["bench"], row.get("text_bytes"), row.get("dict_keys"))
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"]}
+    print(f"\nChange in best time vs {baseline_path} (negative is faster):")
+    for row in results:
+        old = baseline.get(result_key(row))
+        if not old or not old["best_s"]: continue
+        change = (row["best_s"] - old["best_s"]) / old["best_s"] * 100
+        print(f"  {row['bench']:18} text_bytes={row.get('text_bytes')} dict_keys={row.get('dict_keys')}: {change:+6.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tokenize_greedy, split_into_pages, normalize_dict and calculate_hash")
+    parser.add_argument('--text-sizes', default=DEFAULT_TEXT_SIZES, help="text sizes in bytes, e.g. 10K,1M")
+    parser.add_argument('--dict-sizes', default=DEFAULT_DICT_SIZES, help="dictionary sizes in keys, e.g. 100,10K")
+    parser.add_argument('--full', action='store_true', help=f"use {FULL_TEXT_SIZES} texts and {FULL_DICT_SIZES} keys")
+    parser.add_argument('--phrase-ratio', type=float, default=0.2, help="share of multi-word dictionary keys")
+    parser.add_argument('--accent-ratio', type=float, default=0.3, help="share of vocabulary words with an accent")
+    parser.add_argument('--vocabulary', type=int, default=50000, help="distinct words in the synthetic language")
+    parser.add_argument('--tokenize-limit', default='10M', help="largest text size to tokenize")
+    parser.add_argument('--mapped', action='store_true', help="also tokenize with a memory-mapped compiled dictionary")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="skip the extra tracemalloc run for peak memory")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    text_sizes = parse_sizes(FULL_TEXT_SIZES if args.full else args.text_sizes)
+    dict_sizes = parse_sizes(FULL_DICT_SIZES if args.full else args.dict_sizes)
+    tokenize_limit = parse_sizes(args.tokenize_limit)[0]
+    memory = not args.no_memory
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, max(args.vocabulary, 1), args.accent_ratio)
+    results = []
+
+    dictionaries = {}
+    for n_keys in dict_sizes:
+        raw = make_dictionary(random.Random(args.seed + n_keys), vocabulary, n_keys, args.phrase_ratio)
+        params = {"dict_keys": n_keys}
+        entries, times, peak = measure(lambda: app.normalize_dict(raw), args.repeat, memory)
+        record(results, "normalize_dict", params, times, peak, n_keys, "keys/s")
+        compiled, times, peak = measure(lambda: app.CompiledDictionary(entries), args.repeat, memory)
+        record(results, "compile_dict", params, times, peak, n_keys, "keys/s")
+        dictionaries[n_keys] = compiled
+
+    for size in text_sizes:
+        text = make_text(random.Random(args.seed + size), vocabulary, size)
+        n_words = len(text.split())
+        params = {"text_bytes": size}
+        _, times, peak = measure(lambda: app.calculate_hash(text), args.repeat, memory)
+        record(results, "calculate_hash", params, times, peak, size / 1e6, "MB/s")
+        pages, times, peak = measure(lambda: app.split_into_pages(text), args.repeat, memory)
+        record(results, "split_into_pages", params, times, peak, n_words, "words/s")
+        if size > tokenize_limit: continue
+        for n_keys, compiled in dictionaries.items():
+            tok_params = {"text_bytes": size, "dict_keys": n_keys}
+            tokenize = lambda d=compiled: [app.tokenize_greedy(page, d) for page in pages]
+            _, times, peak = measure(tokenize, args.repeat, memory)
+            record(results, "tokenize_greedy", tok_params, times, peak, n_words, "words/s")
+            if args.mapped:
+                path = f"bench_{n_keys}.rldict"
+                app.write_compiled_dictionary(path, compiled.entries, compiled.id)
+                try:
+                    mapped = app.MappedDictionary(path)
+                    tokenize = lambda: [app.tokenize_greedy(page, mapped) for page in pages]
+                    _, times, peak = measure(tokenize, args.repeat, memory)
+                    record(results, "tokenize_mapped", tok_params, times, peak, n_words, "words/s")
+                finally:
+                    os.remove(path)
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.compare: compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
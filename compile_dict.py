@@ -0,0 +1,31 @@
+import argparse
+import os
+
+from app import dictionary_format, load_dictionary, write_compiled_dictionary
+
+# Compiles a JSON (or NDJSON / TSV) dictionary into the binary format that
+# app.py maps at startup (or accepts through "Load" in the Dictionary box):
+#
+#   python compile_dict.py dictionary.json            -> dictionary.rldict
+#   python compile_dict.py big.json -o big.rldict
+#   python compile_dict.py glossary.tsv
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a JSON dictionary into a binary .rldict file")
+    parser.add_argument('source', help="JSON, NDJSON (.ndjson, .jsonl) or TSV (.tsv) dictionary")
+    parser.add_argument('-o', '--output', help="output path (default: source with .rldict extension)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.source)[0] + '.rldict'
+    with open(args.source, 'rb') as f:
+        loaded = load_dictionary(f, dictionary_format(args.source), build_matcher=False)
+    entries = loaded.entries
+    tmp_path = output + '.tmp'
+    dict_id = write_compiled_dictionary(tmp_path, entries)
+    os.replace(tmp_path, output)
+    print(f"{output}: {len(entries)} terms, id {dict_id}")
+    if loaded.malformed:
+        print(f"Skipped {loaded.malformed} malformed entries: {', '.join(loaded.malformed_entries)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from synthetic import make_dictionary, make_text, make_vocabulary, parse_sizes
+
+# Local load test: starts the app, simulates readers paging through books
+# and reports throughput and latency per route. Only the standard library is
+# used, and nothing leaves the machine.
+#
+#   python loadtest.py                                      # dev server, 20 readers, 30 s
+#   python loadtest.py --server gunicorn --workers 1,2,4    # one run per worker count
+#   python loadtest.py --dict-sizes 0,10K,100K              # 0 keeps the default dictionary
+#   python loadtest.py --url http://localhost:5000          # an already running server
+#
+# Each reader session loads /, may upload one of a few generated texts and
+# the generated dictionary, then reads page after page with think times in
+# between, now and then jumping to a random page.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+START_DATA_RE = re.compile(r'const startData = (\{.*?\});')
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(kind, workers, threads, port):
+    bind = f"127.0.0.1:{port}"
+    if kind == 'gunicorn':
+        cmd = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+               '-b', bind, '--log-level', 'warning', 'app:app']
+    else:
+        cmd = [sys.executable, '-c', f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    return subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_for_server(url, proc, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(url + '/', timeout=2) as resp:
+                if resp.status == 200: return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start within {timeout} s")
+
+def stop_server(proc):
+    if proc is None: return
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+def multipart(fields, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8') + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def percentile(sorted_values, q):
+    if not sorted_values: return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+class Recorder:
+    # Latencies per route for one reader; merged after the run, so no locking
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def request(self, url, route, body=None, content_type=None, name=None):
+        headers = {'Content-Type': content_type} if content_type else {}
+        req = urllib.request.Request(url + route, data=body, headers=headers)
+        route = name or route
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                payload = resp.read()
+            ok = True
+        except urllib.error.HTTPError as e:
+            payload = e.read()
+            ok = False
+        except OSError:
+            payload = b''
+            ok = False
+        self.latencies.setdefault(route, []).append(time.perf_counter() - start)
+        if not ok: self.errors[route] = self.errors.get(route, 0) + 1
+        return payload if ok else None
+
+    def post_json(self, url, route, data):
+        payload = self.request(url, route, json.dumps(data).encode('utf-8'), 'application/json')
+        return json.loads(payload) if payload is not None else None
+
+    def upload(self, url, route, fields, filename, content):
+        body, content_type = multipart(fields, filename, content)
+        payload = self.request(url, route, body, content_type)
+        return json.loads(payload) if payload is not None else None
+
+def reader(url, args, texts, dictionary, seed, deadline, recorder):
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        html = recorder.request(url, '/')
+        if html is None:
+            time.sleep(1)
+            continue
+        match = START_DATA_RE.search(html.decode('utf-8'))
+        state = json.loads(match.group(1)) if match else {"hash": None, "totalPages": 0}
+        f_hash, total = state["hash"], state["totalPages"]
+        dict_id = None
+        if dictionary is not None and rng.random() < args.dict_upload_ratio:
+            result = recorder.upload(url, '/upload_dict', {}, 'dictionary.json', dictionary)
+            if result: dict_id = result["dictionary_id"]
+        if texts and (not f_hash or rng.random() < args.upload_ratio):
+            fields = {"dictionary": dict_id} if dict_id else {}
+            result = recorder.upload(url, '/upload_text', fields, 'book.txt', rng.choice(texts))
+            while result and result["state"] == "running":
+                time.sleep(0.2)
+                payload = recorder.request(url, f"/upload_status?job={result['job'] or ''}&hash={result['hash']}", name='/upload_status')
+                result = json.loads(payload) if payload is not None else None
+            if result and result["state"] == "done": f_hash, total = result["hash"], result["total_pages"]
+        if not f_hash or not total:
+            time.sleep(1)
+            continue
+
+        # Pages already fetched in this session stand in for the client's page cache
+        fetched = set()
+        page = 0
+        for _ in range(args.session_pages):
+            if time.monotonic() >= deadline: return
+            if page not in fetched:
+                data = {"hash": f_hash, "page": page, "dictionary": dict_id, "format": args.format}
+                if args.get:
+                    query = f"?format={args.format}" + (f"&dictionary={dict_id}" if dict_id else "")
+                    payload = recorder.request(url, f"/page/{f_hash}/{page}{query}", name='/page')
+                    result = json.loads(payload) if payload is not None else None
+                    if result: fetched.add(page)
+                elif args.batch > 1:
+                    data["count"] = args.batch
+                    result = recorder.post_json(url, '/get_pages', data)
+                    if result: fetched.update(p["page_idx"] for p in result["pages"])
+                else:
+                    result = recorder.post_json(url, '/get_page', data)
+                    if result: fetched.add(page)
+                if result is None: break
+            if args.think: time.sleep(rng.expovariate(1.0 / args.think))
+            if rng.random() < args.jump_ratio:
+                page = rng.randrange(total)
+            else:
+                page = min(page + 1, total - 1)
+
+def run(url, args, texts, dictionary, label):
+    deadline = time.monotonic() + args.ramp + args.duration
+    recorders = [Recorder() for _ in range(args.readers)]
+    threads = []
+    for i, recorder in enumerate(recorders):
+        thread = threading.Thread(target=reader, args=(url, args, texts, dictionary, args.seed + i, deadline, recorder), daemon=True)
+        threads.append(thread)
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+        if args.ramp: time.sleep(args.ramp / len(threads))
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    routes = {}
+    for recorder in recorders:
+        for route, latencies in recorder.latencies.items():
+            routes.setdefault(route, []).extend(latencies)
+    rows = []
+    for route, latencies in sorted(routes.items()):
+        latencies.sort()
+        errors = sum(r.errors.get(route, 0) for r in recorders)
+        rows.append({
+            "route": route,
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": latencies[-1] * 1000,
+        })
+    total = sum(row["requests"] for row in rows)
+    print(f"\n{label}: {total} requests in {elapsed:.1f} s, {total / elapsed:.1f} req/s")
+    print(f"  {'route':14} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for row in rows:
+        print(f"  {row['route']:14} {row['requests']:9} {row['errors']:7} {row['rps']:8.1f} "
+              f"{row['p50_ms']:9.2f} {row['p99_ms']:9.2f} {row['max_ms']:9.2f}")
+    return {"elapsed_s": elapsed, "requests": total, "rps": total / elapsed, "routes": rows}
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent readers against a local server")
+    parser.add_argument('--url', help="test a running server instead of starting one")
+    parser.add_argument('--server', choices=['flask', 'gunicorn'], default='flask')
+    parser.add_argument('--workers', default='1', help="gunicorn worker counts to compare, e.g. 1,2,4")
+    parser.add_argument('--threads', type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument('--readers', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help="seconds per run after the ramp-up")
+    parser.add_argument('--ramp', type=float, default=5, help="seconds over which readers start")
+    parser.add_argument('--think', type=float, default=1.0, help="mean think time between pages, 0 for none")
+    parser.add_argument('--jump-ratio', type=float, default=0.05, help="share of page turns that jump to a random page")
+    parser.add_argument('--session-pages', type=int, default=50, help="pages read before a reader reloads /")
+    parser.add_argument('--batch', type=int, default=1, help="fetch this many pages per /get_pages call, 1 uses /get_page")
+    parser.add_argument('--get', action='store_true', help="fetch pages with GET /page/<hash>/<page>")
+    parser.add_argument('--format', type=int, default=2, help="token wire format")
+    parser.add_argument('--dict-sizes', default='0', help="dictionary sizes in keys to compare, 0 keeps the default")
+    parser.add_argument('--dict-upload-ratio', type=float, default=1.0, help="share of sessions that upload the dictionary")
+    parser.add_argument('--texts', type=int, default=4, help="distinct generated texts, 0 reads only the default book")
+    parser.add_argument('--text-size', default='200K', help="size of each generated text in bytes")
+    parser.add_argument('--upload-ratio', type=float, default=0.5, help="share of sessions that upload a text")
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, max(args.vocabulary, 1), 0.3)
+    text_size = parse_sizes(args.text_size)[0]
+    texts = [make_text(random.Random(args.seed + i), vocabulary, text_size).encode('utf-8') for i in range(args.texts)]
+    dictionaries = {}
+    for n_keys in parse_sizes(args.dict_sizes):
+        raw = make_dictionary(random.Random(args.seed + n_keys), vocabulary, n_keys, 0.2) if n_keys else None
+        dictionaries[n_keys] = json.dumps(raw, ensure_ascii=False).encode('utf-8') if raw else None
+
+    worker_counts = [None] if args.url or args.server == 'flask' else [int(w) for w in args.workers.split(',')]
+    results = []
+    for workers in worker_counts:
+        proc = None
+        url = args.url.rstrip('/') if args.url else None
+        if url is None:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            proc = start_server(args.server, workers, args.threads, port)
+        try:
+            wait_for_server(url, proc, args.startup_timeout)
+            for n_keys, dictionary in dictionaries.items():
+                label = f"{args.server if not args.url else url} workers={workers or '-'} dict_keys={n_keys or 'default'}"
+                result = run(url, args, texts, dictionary, label)
+                result.update({"workers": workers, "dict_keys": n_keys})
+                results.append(result)
+        finally:
+            stop_server(proc)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+from itertools import accumulate
+
+# Seeded generators for synthetic texts and dictionaries, shared by bench.py
+# and loadtest.py. Words are built from syllables, a configurable share of
+# them carry an accent, and word frequencies follow a Zipf distribution.
+
+SIZE_SUFFIXES = {'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3}
+
+CONSONANTS = 'bcdfghjlmnprstv'
+VOWELS = 'aeiou'
+ACCENTED = {'a': 'àâ', 'e': 'éèêë', 'i': 'îï', 'o': 'ô', 'u': 'ùû'}
+
+def make_vocabulary(rng, size, accent_ratio):
+    words = set()
+    while len(words) < size:
+        word = "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(1, 4)))
+        if rng.random() < accent_ratio:
+            pos = rng.randrange(1, len(word), 2)
+            word = word[:pos] + rng.choice(ACCENTED[word[pos]]) + word[pos + 1:]
+        words.add(word)
+    return sorted(words)
+
+def zipf_weights(n):
+    return [1.0 / (rank + 1) for rank in range(n)]
+
+def make_dictionary(rng, vocabulary, size, phrase_ratio):
+    # Single words are drawn from the most frequent part of the vocabulary,
+    # phrases of 2-4 words from anywhere in it.
+    # Cumulative weights are computed once; passing plain weights to
+    # choices() would rebuild them for every key.
+    entries = {}
+    cum_weights = list(accumulate(zipf_weights(len(vocabulary))))
+    while len(entries) < size:
+        if rng.random() < phrase_ratio:
+            key = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 4)))
+        else:
+            key = rng.choices(vocabulary, cum_weights=cum_weights)[0]
+        if rng.random() < 0.2: key = key.capitalize()
+        entries[key] = f"gloss {len(entries)}"
+    return entries
+
+def make_text(rng, vocabulary, size):
+    cum_weights = []
+    total = 0.0
+    for w in zipf_weights(len(vocabulary)):
+        total += w
+        cum_weights.append(total)
+    paragraphs = []
+    length = 0
+    while length < size:
+        words = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(20, 400))
+        sentences = []
+        pos = 0
+        while pos < len(words):
+            n = rng.randint(4, 25)
+            sentence = words[pos:pos + n]
+            sentence[0] = sentence[0].capitalize()
+            if len(sentence) > 6 and rng.random() < 0.5: sentence[3] += ','
+            if rng.random() < 0.1: sentence[0] = "l'" + sentence[0]
+            sentences.append(" ".join(sentence) + rng.choice('...!?'))
+            pos += n
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 1
+    return "\n".join(paragraphs)[:size]
+
+def parse_sizes(value):
+    sizes = []
+    for part in value.split(','):
+        part = part.strip().upper()
+        if not part: continue
+        factor = SIZE_SUFFIXES.get(part[-1], 1)
+        sizes.append(int(float(part.rstrip('KMG')) * factor))
+    return sizes
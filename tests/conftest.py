@@ -0,0 +1,44 @@
+import io
+import json
+import os
+import sys
+import time
+
+import pytest
+
+# app.py and the helper scripts live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Test client with its own book and dictionary stores and empty caches
+    monkeypatch.setattr(app, 'FILE_CACHE', app.BookCache(store_dir=str(tmp_path / "books")))
+    monkeypatch.setattr(app, 'DICTIONARIES', app.DictionaryRegistry(10, None, None, str(tmp_path / "dictionaries"), True))
+    monkeypatch.setattr(app, 'PAGE_CACHE', app.LRUCache(1000, None, app.page_cache_size))
+    monkeypatch.setattr(app, 'LAYOUTS', app.LRUCache(10))
+    return app.app.test_client()
+
+@pytest.fixture
+def upload_book(client):
+    # Uploads a text and waits for its ingestion; returns the final status
+    def upload(text, name="book.txt"):
+        data = text.encode('utf-8') if isinstance(text, str) else text
+        job = client.post('/upload_text', data={'file': (io.BytesIO(data), name)}).get_json()
+        for _ in range(200):
+            status = client.get(f"/upload_status?job={job.get('job') or ''}&hash={job['hash']}").get_json()
+            if status["state"] != "running": return status
+            time.sleep(0.02)
+        raise AssertionError("ingestion did not finish")
+    return upload
+
+@pytest.fixture
+def upload_dict(client):
+    # Uploads a JSON dictionary; returns its id
+    def upload(entries):
+        data = json.dumps(entries).encode('utf-8')
+        res = client.post('/upload_dict', data={'file': (io.BytesIO(data), 'dict.json')})
+        assert res.status_code == 200
+        return res.get_json()["dictionary_id"]
+    return upload
@@ -0,0 +1,38 @@
+import io
+import os
+
+import pytest
+
+import app
+
+BAD_HASHES = [None, "", "../outside", "../../etc/passwd", "0" * 31, "0" * 32 + "/x", "G" * 32]
+
+def test_prefix_refuses_non_hashes(tmp_path):
+    cache = app.BookCache(store_dir=str(tmp_path / "books"))
+    for f_hash in BAD_HASHES:
+        with pytest.raises(ValueError):
+            cache._prefix(f_hash)
+        assert cache.get(f_hash) is None
+        assert f_hash not in cache
+        assert not cache.ingesting(f_hash)
+        assert cache.boundaries(f_hash) is None
+
+def test_files_outside_the_store_are_not_books(tmp_path):
+    cache = app.BookCache(store_dir=str(tmp_path / "books"))
+    os.makedirs(tmp_path / "books")
+    app.PagedText.write(str(tmp_path / "outside"), ["page"])
+    assert cache.get("../outside") is None
+    assert "../outside" not in cache
+
+@pytest.mark.parametrize("f_hash", [None, "../outside", "../../etc/passwd"])
+def test_upload_dict_with_bad_hash(client, f_hash):
+    data = {'file': (io.BytesIO(b'{"chat": "cat"}'), 'dict.json')}
+    if f_hash is not None: data['hash'] = f_hash
+    res = client.post('/upload_dict', data=data)
+    assert res.status_code == 200
+    assert res.get_json()["count"] == 1
+
+@pytest.mark.parametrize("f_hash", ["..%2Foutside", "not-a-hash"])
+def test_page_with_bad_hash(client, f_hash):
+    assert client.get(f"/page/{f_hash}/0").status_code == 404
+    assert client.post('/get_page', json={"hash": f_hash.replace("%2F", "/"), "page": 0}).status_code == 404
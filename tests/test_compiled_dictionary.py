@@ -0,0 +1,62 @@
+import io
+import struct
+
+import pytest
+
+import app
+
+ENTRIES = {"le": "the", "petit": "small", "petit prince": "little prince", "élève": "pupil"}
+
+@pytest.fixture
+def compiled(tmp_path):
+    path = tmp_path / "dictionary.rldict"
+    app.write_compiled_dictionary(str(path), ENTRIES)
+    return path.read_bytes()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.DICTIONARIES, 'store_dir', str(tmp_path / "store"))
+    return app.app.test_client()
+
+def upload(client, data):
+    return client.post('/upload_dict', data={'file': (io.BytesIO(data), 'dict.rldict')},
+                       content_type='multipart/form-data')
+
+def with_counts(data, n_exact=None, n_folded=None, n_values=None):
+    magic, exact, folded, values, dict_id = app.RLDICT_HEADER.unpack_from(data)
+    header = app.RLDICT_HEADER.pack(magic, exact if n_exact is None else n_exact,
+                                    folded if n_folded is None else n_folded,
+                                    values if n_values is None else n_values, dict_id)
+    return header + data[len(header):]
+
+def test_valid_upload(client, compiled):
+    res = upload(client, compiled)
+    assert res.status_code == 200
+    assert res.get_json()["count"] == len(ENTRIES)
+
+def test_truncated_file(tmp_path, client, compiled):
+    for size in (app.RLDICT_HEADER.size, app.RLDICT_HEADER.size + 20, len(compiled) // 2, len(compiled) - 1):
+        path = tmp_path / "truncated.rldict"
+        path.write_bytes(compiled[:size])
+        with pytest.raises(ValueError):
+            app.MappedDictionary(str(path), verify=True)
+        assert upload(client, compiled[:size]).status_code == 400
+
+@pytest.mark.parametrize("counts", [
+    {"n_exact": 2 ** 32 - 1}, {"n_folded": 1000}, {"n_values": 2 ** 31},
+    {"n_exact": 1}, {"n_values": 1}, {"n_values": 100},
+])
+def test_corrupted_counts(tmp_path, client, compiled, counts):
+    data = with_counts(compiled, **counts)
+    path = tmp_path / "corrupted.rldict"
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        app.MappedDictionary(str(path), verify=True)
+    assert upload(client, data).status_code == 400
+
+def test_value_id_out_of_range(client, compiled):
+    # The first value id of the exact table follows its n + 1 offsets
+    n_exact = app.RLDICT_HEADER.unpack_from(compiled)[1]
+    ids_pos = app._align(app._align(app.RLDICT_HEADER.size) + 8 * (n_exact + 1))
+    data = compiled[:ids_pos] + struct.pack('<I', 999) + compiled[ids_pos + 4:]
+    assert upload(client, data).status_code == 400
@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+
+import app
+
+CHUNK_SIZES = (1, 2, 3, 7)
+
+DOCUMENTS = [
+    '{}',
+    '{"le": 0.5, "la": -12, "les": 1e-7, "un": 2.5E+10, "une": 0, "des": -0.0}',
+    '{"petit prince": "little prince", "élève": "pupil", "esc\\"aped\\\\": "\\u00e9\\n\\ud83d\\ude00"}',
+    '{"a": [1, 2.25, {"b": "}"}], "c": {"d": null}, "e": true, "f": false, "g": 123456789012}',
+    ' \n{ "x" : 1.0 ,\r\n "y":"z" }\n ',
+]
+
+def entries(data, chunk_size):
+    return [(key, value) for key, value, _ in app.iter_json_entries(io.BytesIO(data), chunk_size)]
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_json_entries_match_json_loads(document, chunk_size):
+    data = document.encode('utf-8')
+    assert entries(data, chunk_size) == list(json.loads(data).items())
+
+@pytest.mark.parametrize('encoding', ['utf-8-sig', 'utf-16', 'utf-16-le', 'utf-16-be'])
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_json_entries_detect_encoding(encoding, chunk_size):
+    data = DOCUMENTS[2].encode(encoding)
+    assert entries(data, chunk_size) == list(json.loads(data).items())
+
+def test_number_split_at_chunk_boundary():
+    # "0." ends the first chunk; it must not be read as 0
+    prefix = '{"pad": "' + 'x' * 100 + '", "le": 0'
+    data = (prefix + '.5, "la": 1e+3}').encode('utf-8')
+    assert entries(data, len(prefix) + 1) == [("pad", "x" * 100), ("le", 0.5), ("la", 1000.0)]
+
+@pytest.mark.parametrize('document', ['[1]', '{"a": 1', '{"a" 1}', '{"a": 1,}', '{"a": 1} x', '', '{"a": 0.}'])
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_invalid_json_is_rejected(document, chunk_size):
+    with pytest.raises(ValueError):
+        entries(document.encode('utf-8'), chunk_size)
+
+def test_loader_matches_normalize_dict():
+    raw = {"Petit Prince": "lp", "élève": "pupil", "Élève": "Pupil", "eleve": "student", "...": "x"}
+    loaded = app.load_dictionary(io.BytesIO(json.dumps(raw).encode('utf-8')))
+    expected = app.normalize_dict(raw)
+    assert loaded.entries == expected
+    assert loaded.malformed == 1
+    matcher = app.PhraseMatcher(expected)
+    assert loaded.matcher.exact_root == matcher.exact_root
+    assert loaded.matcher.folded_root == matcher.folded_root
+
+def test_line_formats():
+    ndjson = b'["Petit Prince", "lp"]\n{"rose": "r"}\n\nnot json\n[1, 2, 3]\n'
+    loaded = app.load_dictionary(io.BytesIO(ndjson), '.ndjson')
+    assert loaded.entries == {"petit prince": "lp", "rose": "r"}
+    assert loaded.malformed_entries == ["line 4", "line 5"]
+    tsv = "Petit prince\tle\tpp\r\nrose\trose\nbad line\n".encode('utf-8')
+    loaded = app.load_dictionary(io.BytesIO(tsv), '.tsv')
+    assert loaded.entries == {"petit prince": "le\tpp", "rose": "rose"}
+    assert loaded.malformed_entries == ["line 3"]
+
+def test_last_duplicate_wins():
+    # "petit" repeats after "Petit"; json.load would keep it at its first
+    # position, so normalize_dict would pick "B"
+    data = '{"petit": "A", "Petit": "B", "élève": "x", "eleve": "y", "petit": "C", "Élève": "z"}'.encode('utf-8')
+    loaded = app.load_dictionary(io.BytesIO(data))
+    assert loaded.entries == {"petit": "C", "élève": "z", "eleve": "y"}
+    matcher = app.PhraseMatcher(loaded.entries)
+    assert loaded.matcher.exact_root == matcher.exact_root
+    assert loaded.matcher.folded_root == matcher.folded_root
+    assert app.CompiledDictionary(loaded.entries).id == app.dictionary_hash({"petit": "C", "élève": "z", "eleve": "y"})
@@ -0,0 +1,96 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import app
+
+TEXT = "\n".join(f"Le petit prince dort sur l'astéroïde B612, ligne {i}." for i in range(300))
+
+def wait_for(client, job):
+    for _ in range(200):
+        status = client.get(f"/upload_status?job={job['job']}").get_json()
+        if status["state"] != "running": return status
+        time.sleep(0.02)
+    raise AssertionError("ingestion did not finish")
+
+def upload(client, data):
+    return client.post('/upload_text', data={'file': (io.BytesIO(data), 'book.txt')}).get_json()
+
+@pytest.fixture
+def paused(monkeypatch):
+    # Ingestion stops after the first 100 lines until the event is set
+    resume = threading.Event()
+    read = threading.Event()
+    iter_lines = app.iter_lines
+    def paused_lines(stream, *args, **kwargs):
+        for n, line in enumerate(iter_lines(stream, *args, **kwargs)):
+            if n == 100:
+                read.set()
+                assert resume.wait(5)
+            yield line
+    monkeypatch.setattr(app, 'iter_lines', paused_lines)
+    yield read, resume
+    resume.set()
+
+def test_partial_book_is_read_from_part_files(client, paused):
+    read, resume = paused
+    job = upload(client, TEXT.encode('utf-8'))
+    f_hash = job["hash"]
+    assert read.wait(5)
+    prefix = os.path.join(app.FILE_CACHE.store_dir, f_hash)
+    assert os.path.exists(prefix + '.part.idx')
+    assert not os.path.exists(prefix + '.idx')
+    # Another worker sees the book through its partial files
+    other = app.BookCache(store_dir=app.FILE_CACHE.store_dir)
+    assert other.ingesting(f_hash)
+    assert other.begin(f_hash) is None
+    ready = len(other.get(f_hash))
+    assert ready > 0
+    status = client.get(f"/upload_status?hash={f_hash}").get_json()
+    assert status["state"] == "running" and status["total_pages"] is None
+    assert client.post('/get_page', json={"hash": f_hash, "page": 0}).status_code == 200
+    assert client.post('/get_page', json={"hash": f_hash, "page": 1000}).status_code == 409
+
+    resume.set()
+    status = wait_for(client, job)
+    assert status["state"] == "done"
+    expected = app.split_into_pages(TEXT)
+    assert status["total_pages"] == len(expected) > ready
+    assert not any(os.path.exists(prefix + '.part' + ext) for ext in app.BOOK_FILES)
+    assert all(os.path.exists(prefix + ext) for ext in app.BOOK_FILES)
+    assert not other.ingesting(f_hash)
+    assert list(other.get(f_hash)) == expected
+
+def test_failed_job_is_reported(client):
+    data = TEXT.encode('utf-8') + b"\nbad \xff\xfe bytes\n"
+    job = upload(client, data)
+    status = wait_for(client, job)
+    assert status["state"] == "failed"
+    assert status["error"] == "Text must be UTF-8"
+    f_hash = hashlib.md5(data).hexdigest()
+    prefix = os.path.join(app.FILE_CACHE.store_dir, f_hash)
+    assert not any(os.path.exists(prefix + '.part' + ext) for ext in app.BOOK_FILES)
+    assert f_hash not in app.FILE_CACHE
+    assert client.get(f"/upload_status?hash={f_hash}").status_code == 404
+    assert client.post('/get_page', json={"hash": f_hash, "page": 0}).status_code == 404
+    # The same upload can be tried again
+    again = upload(client, data)
+    assert again["job"] != job["job"]
+    assert wait_for(client, again)["state"] == "failed"
+
+def test_stale_part_files_are_taken_over(client):
+    data = TEXT.encode('utf-8')
+    f_hash = hashlib.md5(data).hexdigest()
+    prefix = os.path.join(app.FILE_CACHE.store_dir, f_hash + '.part')
+    os.makedirs(app.FILE_CACHE.store_dir)
+    for ext in app.BOOK_FILES:
+        with open(prefix + ext, 'wb') as f: f.write(b'\0' * 8)
+    old = time.time() - app.INGEST_STALE_AFTER - 1
+    os.utime(prefix + '.idx', (old, old))
+    job = upload(client, data)
+    assert job["job"] is not None
+    assert wait_for(client, job)["total_pages"] == len(app.split_into_pages(TEXT))
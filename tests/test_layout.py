@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+import app
+
+WORDS = ["le", "petit", "prince", "élève", "naïf", "chat", "dort", "aussi", "x", "astéroïde", "B612", "«oui»"]
+
+def random_text(rng):
+    # Paragraphs from one word to several pages long, with blank and
+    # padded lines, multi-byte characters and runs of spaces after sentences
+    lines = []
+    for _ in range(rng.randint(0, 60)):
+        if rng.random() < 0.1:
+            lines.append(rng.choice(["", "   ", "\t"]))
+            continue
+        sentences = []
+        for _ in range(rng.choice([1, 1, 2, 5, 40])):
+            words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30)))
+            sentences.append(words + rng.choice([".", "!", "?", "", ","]))
+        line = (" " * rng.randint(1, 3)).join(sentences)
+        lines.append(" " * rng.randint(0, 2) + line + rng.choice(["", "  ", "\r"]))
+    return "\n".join(lines)
+
+def boundary_index(text, tmp_path=None):
+    if tmp_path is None:
+        writer = app.BoundaryWriter()
+        for line in text.split('\n'): writer.add(line)
+        return writer.finish()
+    prefix = str(tmp_path / "book")
+    with open(prefix + '.src', 'wb') as src:
+        writer = app.BoundaryWriter(src)
+        for line in text.split('\n'): writer.add(line)
+    with open(prefix + '.bnd', 'wb') as bnd:
+        writer.finish(bnd)
+    return app.BoundaryIndex.open(prefix)
+
+@pytest.mark.parametrize("seed", range(40))
+def test_layout_matches_split_into_pages(seed):
+    rng = random.Random(seed)
+    text = random_text(rng)
+    index = boundary_index(text)
+    for max_chars in [1, 7, rng.randint(1, 100), rng.randint(100, 2000), app.DEFAULT_PAGE_SIZE, app.MAX_PAGE_SIZE]:
+        expected = app.split_into_pages(text, max_chars)
+        layout = app.Layout(index, max_chars)
+        assert len(layout) == len(expected), max_chars
+        assert [layout[i] for i in range(len(layout))] == expected, max_chars
+
+@pytest.mark.parametrize("seed", range(5))
+def test_stored_layout_matches_split_into_pages(tmp_path, seed):
+    rng = random.Random(1000 + seed)
+    text = random_text(rng)
+    index = boundary_index(text, tmp_path)
+    for max_chars in [rng.randint(1, 100), rng.randint(100, 2000)]:
+        layout = app.Layout(index, max_chars)
+        assert [layout[i] for i in range(len(layout))] == app.split_into_pages(text, max_chars)
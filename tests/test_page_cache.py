@@ -0,0 +1,77 @@
+import gzip
+
+import pytest
+
+import app
+
+TEXT = "\n".join(f"Le petit prince dort. Le chat dort aussi, page {i}." for i in range(400))
+ENTRIES = {"prince": "prince", "le petit": "the little", "chat": "cat"}
+
+def test_page_range_matches_single_pages(client, upload_book, upload_dict):
+    status = upload_book(TEXT)
+    f_hash, total = status["hash"], status["total_pages"]
+    assert total > 3
+    dict_id = upload_dict(ENTRIES)
+    query = f"?format=2&dictionary={dict_id}"
+    res = client.get(f"/pages/{f_hash}/1/{total + 5}{query}")
+    assert res.status_code == 200
+    pages = res.get_json()["pages"]
+    assert [p["page_idx"] for p in pages] == list(range(1, min(total, 1 + app.MAX_PAGES_PER_REQUEST)))
+    for page in pages:
+        assert client.get(f"/page/{f_hash}/{page['page_idx']}{query}").get_json() == page
+
+def test_page_range_errors(client, upload_book):
+    f_hash = upload_book(TEXT)["hash"]
+    assert client.get(f"/pages/{f_hash}/3/3").status_code == 400
+    assert client.get(f"/pages/{f_hash}/10000/10001").status_code == 400
+    assert client.get(f"/pages/{'0' * 32}/0/2").status_code == 404
+    assert client.get(f"/pages/{f_hash}/0/2?dictionary=expired").status_code == 404
+
+@pytest.fixture
+def page_url(client, upload_book, upload_dict):
+    # URLs of page 0 and of the first pages through the batched route
+    f_hash = upload_book(TEXT)["hash"]
+    query = f"?format=2&dictionary={upload_dict(ENTRIES)}"
+    return [f"/page/{f_hash}/0{query}", f"/pages/{f_hash}/0/3{query}"]
+
+def test_etag_revalidation(client, page_url):
+    for url in page_url:
+        res = client.get(url)
+        assert res.status_code == 200
+        assert "immutable" in res.headers["Cache-Control"]
+        etag = res.headers["ETag"]
+        again = client.get(url, headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.headers["ETag"] == etag
+        assert not again.data
+        assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+def test_default_dictionary_pages_are_revalidated(client, upload_book):
+    f_hash = upload_book(TEXT)["hash"]
+    for url in [f"/page/{f_hash}/0", f"/pages/{f_hash}/0/3"]:
+        res = client.get(url)
+        assert res.headers["Cache-Control"] == "no-cache"
+        assert client.get(url, headers={"If-None-Match": res.headers["ETag"]}).status_code == 304
+
+def test_gzip_negotiation(client, page_url):
+    for url in page_url:
+        plain = client.get(url)
+        assert "Content-Encoding" not in plain.headers
+        res = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert res.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in res.headers["Vary"]
+        assert gzip.decompress(res.data) == plain.data
+        # Each encoding has its own tag, and either revalidates
+        assert res.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+        for etag in (plain.headers["ETag"], res.headers["ETag"]):
+            assert client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+        assert "Content-Encoding" not in client.get(url, headers={"Accept-Encoding": "identity"}).headers
+
+def test_brotli_negotiation(client, page_url):
+    brotli = pytest.importorskip("brotli")
+    for url in page_url:
+        plain = client.get(url)
+        res = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+        assert res.headers["Content-Encoding"] == "br"
+        assert brotli.decompress(res.data) == plain.data
+        assert client.get(url, headers={"Accept-Encoding": "gzip;q=1, br;q=0.5"}).headers["Content-Encoding"] == "gzip"
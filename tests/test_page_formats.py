@@ -0,0 +1,32 @@
+import pytest
+
+import app
+
+TEXT = "Le petit prince dort.\nLe chat dort aussi."
+ENTRIES = {"prince": ["prince", "ruler"], "dort": {"m": "sleeps"}, "le petit": "the little", "aussi": "also"}
+
+def expand(page):
+    # Token list of a version 2 page
+    return [{"text": text, "ref": ref, "translation": page["translations"][ref] if ref >= 0 else None}
+            for text, ref in zip(page["text"], page["ref"])]
+
+@pytest.mark.parametrize("entries", [
+    ENTRIES,
+    {"chat": 1, "dort": True, "prince": 1.5, "aussi": None, "le petit": 0},
+])
+def test_formats_agree(client, upload_book, upload_dict, entries):
+    f_hash = upload_book(TEXT)["hash"]
+    dict_id = upload_dict(entries)
+    legacy = client.post('/get_page', json={"hash": f_hash, "page": 0, "dictionary": dict_id}).get_json()["tokens"]
+    compact = client.post('/get_page', json={"hash": f_hash, "page": 0, "dictionary": dict_id, "format": 2}).get_json()["tokens"]
+    res = client.get(f"/page/{f_hash}/0?format=2&dictionary={dict_id}")
+    assert res.status_code == 200
+    assert res.get_json()["tokens"] == compact
+    tokens = expand(compact)
+    assert [t["text"] for t in tokens] == [t["text"] for t in legacy]
+    for token, t in zip(tokens, legacy):
+        if t.get("newline"): assert token["ref"] == app.TOKEN_NEWLINE
+        elif not t["clickable"]: assert token["ref"] == app.TOKEN_PLAIN
+        else: assert token["translation"] == t["translation"]
+    # Equal translations share one table entry
+    assert len(compact["translations"]) == len({app.json.dumps(t, sort_keys=True) for t in compact["translations"]})
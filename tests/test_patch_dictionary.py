@@ -0,0 +1,42 @@
+import pytest
+
+import app
+
+ENTRIES = {"élève": "pupil", "eleve": "student", "étoile": "star", "le petit": "the little",
+           "petit prince": "little prince", "chat": "cat"}
+TEXT = "Le petit prince, un élève, une etoile et un chat. Eleve étoile!"
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = app.DictionaryRegistry(10, None, None, str(tmp_path), True)
+    monkeypatch.setattr(app, 'DICTIONARIES', registry)
+    return registry
+
+def test_patch_matches_full_dictionary(registry):
+    base = registry.register(app.normalize_dict(ENTRIES))
+    patched, changed = app.patch_dictionary(base, {"Chien": "dog", "étoile": "STAR"}, ["eleve", "rose"])
+    assert changed == {"chien", "étoile", "eleve"}
+    patched, _ = app.patch_dictionary(patched, {"le petit": "small"}, ["élève"])
+    full = app.CompiledDictionary(dict(patched.items()))
+    assert len(patched) == len(full.entries)
+    assert app.tokenize_greedy(TEXT, patched) == app.tokenize_greedy(TEXT, full)
+    assert app.tokenize_greedy(TEXT, base) == app.tokenize_greedy(TEXT, app.CompiledDictionary(app.normalize_dict(ENTRIES)))
+
+def test_patch_ids(registry):
+    base = registry.register(app.normalize_dict(ENTRIES))
+    one, _ = app.patch_dictionary(base, {"chien": "dog"}, [])
+    two, _ = app.patch_dictionary(one, {"chat": "kitten"}, [])
+    both, _ = app.patch_dictionary(base, {"chat": "kitten", "chien": "dog"}, [])
+    assert two.id == both.id != one.id
+    assert app.patch_dictionary(both, {"chat": "cat"}, ["chien"])[0].id == base.id
+    assert app.patch_dictionary(base, {"chat": "cat"}, [])[0] is base
+
+def test_patch_reloaded_from_store(registry):
+    base = registry.register(app.normalize_dict(ENTRIES))
+    patched, _ = app.patch_dictionary(base, {"chien": "dog"}, ["étoile"])
+    registry.persist_pool.submit(lambda: None).result()
+    registry.compiled.pop(patched.id)
+    registry.compiled.pop(base.id)
+    reloaded = registry.get(patched.id)
+    assert reloaded.id == patched.id
+    assert dict(reloaded.items()) == dict(patched.items())
@@ -0,0 +1,52 @@
+import pytest
+
+import app
+
+ENTRIES = {
+    "élève": "pupil", "eleve": "raised", "élevé": "high",
+    "petit": "small", "petit élève": "young pupil",
+    "le petit": "the little", "Le Petit Prince": "The Little Prince",
+}
+
+@pytest.fixture(params=["compiled", "mapped"])
+def dictionary(request, tmp_path):
+    def make(raw):
+        entries = app.normalize_dict(raw)
+        if request.param == "compiled": return app.CompiledDictionary(entries)
+        path = str(tmp_path / "dictionary.rldict")
+        app.write_compiled_dictionary(path, entries)
+        return app.MappedDictionary(path)
+    return make
+
+def matches(text, dictionary):
+    return [(t["text"], t["translation"]) for t in app.tokenize_greedy(text, dictionary) if t["clickable"]]
+
+@pytest.mark.parametrize("text, expected", [
+    # An exact spelling wins over an accent-free one of the same length
+    ("élève", [("élève", "pupil")]),
+    ("Élève", [("Élève", "pupil")]),
+    ("élevé", [("élevé", "high")]),
+    ("eleve", [("eleve", "raised")]),
+    ("ELEVE", [("ELEVE", "raised")]),
+    # Misspelled accents match through the folded trie, held by the
+    # unaccented key
+    ("elève", [("elève", "raised")]),
+    ("élêve", [("élêve", "raised")]),
+    # A longer folded match wins over a shorter exact one
+    ("petit eleve", [("petit eleve", "young pupil")]),
+    ("petit élève", [("petit élève", "young pupil")]),
+    ("le petit prince dort", [("le petit prince", "The Little Prince")]),
+    # Punctuation does not break a phrase, newlines do
+    ("petit, élève!", [("petit, élève!", "young pupil")]),
+    ("Le petit\nprince", [("Le petit", "the little")]),
+])
+def test_exact_and_folded_matches(dictionary, text, expected):
+    assert matches(text, dictionary(ENTRIES)) == expected
+
+def test_folded_key_held_by_first_accented_spelling(dictionary):
+    # Without an unaccented key, the first key folding to a spelling holds it
+    d = dictionary({"élève": "pupil", "élevé": "high"})
+    assert matches("eleve", d) == [("eleve", "pupil")]
+    assert matches("élevé", d) == [("élevé", "high")]
+    d = dictionary({"élevé": "high", "élève": "pupil"})
+    assert matches("eleve", d) == [("eleve", "high")]
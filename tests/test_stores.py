@@ -0,0 +1,73 @@
+import os
+import time
+
+import app
+
+ENTRIES = {"le petit": "the little", "prince": "prince", "élève": "pupil"}
+TEXT = "Le petit prince est un élève."
+
+def test_hot_mapped_dictionary_is_compiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'MAPPED_DICT_RECOMPILE_AFTER', 3)
+    registry = app.DictionaryRegistry(10, None, None, str(tmp_path), True)
+    dictionary = registry.register(app.normalize_dict(ENTRIES))
+    registry.persist_pool.submit(lambda: None).result()
+    registry.compiled.pop(dictionary.id)
+    for _ in range(3):
+        mapped = registry.get(dictionary.id)
+        assert isinstance(mapped, app.MappedDictionary)
+    registry.compile_pool.submit(lambda: None).result()
+    compiled = registry.get(dictionary.id)
+    assert isinstance(compiled, app.CompiledDictionary)
+    assert compiled.id == dictionary.id
+    assert app.tokenize_greedy(TEXT, compiled) == app.tokenize_greedy(TEXT, mapped)
+
+def test_provided_binary_dictionaries_stay_mapped(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'MAPPED_DICT_RECOMPILE_AFTER', 3)
+    registry = app.DictionaryRegistry(10, None, None, str(tmp_path / "store"), True)
+    path = tmp_path / "dictionary.rldict"
+    app.write_compiled_dictionary(str(path), app.normalize_dict(ENTRIES))
+    provided = registry.register_compiled(str(path))
+    with open(path, 'rb') as f:
+        uploaded = registry.ingest_compiled(f)
+    for _ in range(5):
+        registry.get(provided.id)
+        registry.get(uploaded.id)
+    registry.compile_pool.submit(lambda: None).result()
+    assert isinstance(registry.get(provided.id), app.MappedDictionary)
+    assert isinstance(registry.get(uploaded.id), app.MappedDictionary)
+
+def write(directory, name, size, age):
+    path = directory / name
+    path.write_bytes(b'x' * size)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+def test_sweep_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'STORE_TTL', 1000)
+    old, older, recent, kept = ('%032x' % i for i in range(4))
+    write(tmp_path, old + '.idx', 10, 500)
+    write(tmp_path, old + '.txt', 100, 500)
+    write(tmp_path, older + '.rldict', 100, 2000)
+    write(tmp_path, recent + '.rldict', 100, 10)
+    write(tmp_path, kept + '.rldict', 100, 5000)
+    write(tmp_path, old + '.part.idx', 100, 5000)
+    write(tmp_path, 'upload.1.2.tmp', 100, 5000)
+    # Expired items go even under the limit
+    assert app.sweep_dir(str(tmp_path), 320, {kept}) == 1
+    assert not (tmp_path / (older + '.rldict')).exists()
+    # Then the least recently used, until under the limit
+    assert app.sweep_dir(str(tmp_path), 250, {kept}) == 1
+    assert sorted(os.listdir(tmp_path)) == sorted([recent + '.rldict', kept + '.rldict',
+                                                   old + '.part.idx', 'upload.1.2.tmp'])
+    assert time.time() - os.path.getmtime(tmp_path / (kept + '.rldict')) < 60
+    assert app.sweep_dir(str(tmp_path), None, set()) == 0
+
+def test_trim_page_store(tmp_path):
+    store = app.SQLiteStore(str(tmp_path / 'pages.sqlite3'))
+    for i in range(10): store.put('pages', str(i), 'x')
+    store.put('pages', '0', 'y')
+    store.put('other', 'a', 'z')
+    store.trim('pages', 3)
+    assert [store.get('pages', str(i)) for i in (0, 8, 9, 7)] == ['y', 'x', 'x', None]
+    assert store.get('other', 'a') == 'z'